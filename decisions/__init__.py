@@ -0,0 +1,43 @@
+import importlib
+
+"""
+Token task: sequence generation, stimuli, the experiment and its analysis.
+
+`import decisions` loads nothing else: the functions below are imported from
+their module when first used (e.g. `decisions.make_trial`). Only the
+experiment (tokens.py, `decisions run`) imports PsychoPy.
+"""
+
+__version__ = '0.8'
+
+# Public functions and the module that defines them
+_EXPORTS = {'make_trial'         : 'tokentools',
+            'compile_template'   : 'tokentools',
+            'check_templates'    : 'tokentools',
+            'get_prob_matrix'    : 'tokentools',
+            'generate_batch'     : 'batchtools',
+            'build_corpus'       : 'corpus',
+            'load_corpus'        : 'corpus',
+            'order_conditions'   : 'ordering',
+            'session_plan'       : 'seeding',
+            'generate_session'   : 'seeding',
+            'prepare_trial'      : 'pipeline',
+            'compile_session'    : 'bundle',
+            'load_session'       : 'bundle',
+            'verify_session'     : 'bundle',
+            'read_data'          : 'analysis',
+            'analyse_file'       : 'analysis',
+            'trajectory_metrics' : 'analysis',
+            'fit_file'           : 'models',
+            'compare_models'     : 'models',
+            'run_session'        : 'headless'}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
@@ -0,0 +1,304 @@
+import argparse
+import csv
+import glob
+import os
+import numpy as np
+
+"""
+Offline analysis of the mouse trajectories in the data files.
+
+The `path`, `times` and `velocity` columns of the CSV files are lists written
+as text. They are parsed in one pass per column into ragged arrays: a flat
+buffer with all the frames of all trials, and offsets (trial k is
+offsets[k]:offsets[k+1]). When the frames went to the sidecar (see
+writer.py) the same arrays are read from there. Trajectory metrics are then
+computed for all trials at once with segment operations on the flat buffers,
+and participant files are processed in parallel:
+
+    decisions analyse data/*.csv --out metrics.csv
+"""
+
+# Columns of the data files read as numbers
+INTEGER_COLUMNS = ('hz', 'num_tokens', 'normal_speed', 'fast_speed', 'trial', 'acc')
+FLOAT_COLUMNS = ('rt',)
+# Characters removed from the list columns before parsing
+_LIST_CHARS = str.maketrans('', '', "[]() '\"")
+
+
+def parse_list_column(values, width=1):
+    """Parses a column of lists written as text (e.g. "[(0.0, -400.0), ...]"
+    or "['NA', 1.5]") into a flat array and per-row offsets. 'NA' becomes NaN
+    and empty cells are rows without values.
+    :param list values: the text of each row
+    :param int width: values per item (2 for the (x, y) path)
+    :returns: flat array of shape (total,) or (total, width), and offsets
+        of shape (rows+1,)
+    """
+
+    cleaned = [value.translate(_LIST_CHARS).replace('NA', 'nan') for value in values]
+    counts = np.array([value.count(',') + 1 if value else 0 for value in cleaned], dtype=np.int64)
+    text = ','.join(value for value in cleaned if value)
+    flat = np.array(text.split(','), dtype=float) if text else np.zeros(0)
+    if width > 1:
+        flat = flat.reshape(-1, width)
+        counts //= width
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return flat, offsets
+
+
+def read_data(filename):
+    """Reads a data file into arrays.
+    :param str filename: CSV file written by tokens.py
+    :returns: dict with one array per column (numbers for INTEGER_COLUMNS
+        and FLOAT_COLUMNS, text otherwise), 'probs' (rows, num_tokens+1) and
+        the ragged frame data 'offsets', 'path' (frames, 2), 'times' and 'velocity'
+    """
+
+    with open(filename, newline='') as data_file:
+        rows = list(csv.reader(data_file))
+    header, rows = rows[0], rows[1:]
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(header)}
+
+    data = {}
+    for name, values in columns.items():
+        if name in INTEGER_COLUMNS:
+            data[name] = np.array(values, dtype=float).astype(np.int64)
+        elif name in FLOAT_COLUMNS:
+            data[name] = np.array([value if value not in ('', 'NA') else 'nan' for value in values], dtype=float)
+        elif name not in ('probs', 'path', 'times', 'velocity'):
+            data[name] = np.array(values)
+    probs, offsets = parse_list_column(columns['probs'])
+    data['probs'] = probs.reshape(len(rows), -1) if len(rows) else probs
+
+    sidecar = filename[:-4] + '_frames'
+    if (os.path.isdir(sidecar) or os.path.exists(sidecar + '.npz')) and not any(columns['times']):
+        #frames saved in the sidecar
+        data['offsets'], data['path'], data['times'], data['velocity'] = read_frames(sidecar, data['trial'])
+    else:
+        data['path'], data['offsets'] = parse_list_column(columns['path'], width=2)
+        data['times'], _ = parse_list_column(columns['times'])
+        data['velocity'], _ = parse_list_column(columns['velocity'])
+    return data
+
+
+def read_frames(sidecar, trials):
+    """Per-frame arrays of some trials from a sidecar (see writer.py): a
+    folder with one `trial_<k>.npz` per trial, or, in older data, a single
+    .npz of flat buffers with offsets.
+    :param str sidecar: the sidecar, without '.npz'
+    :param trials: trial numbers, in the order of the rows
+    :returns: offsets, path (frames, 2), times and velocity
+    """
+
+    if not os.path.isdir(sidecar):
+        with np.load(sidecar + '.npz') as frames:
+            order = {trial: k for k, trial in enumerate(frames['trial'].tolist())}
+            pick = [order[int(trial)] for trial in trials]
+            return select_segments(frames['offsets'], pick, frames['path'], frames['times'], frames['velocity'])
+
+    path, times, velocity = [np.zeros((0, 2))], [np.zeros(0)], [np.zeros(0)]
+    for trial in trials:
+        with np.load(sidecar + os.path.sep + 'trial_%s.npz' % trial) as frames:
+            path += [frames['path']]
+            times += [frames['times']]
+            velocity += [frames['velocity']]
+    offsets = np.cumsum([len(t) for t in times]).astype(np.int64)  #starts with the empty 0
+    return offsets, np.concatenate(path), np.concatenate(times), np.concatenate(velocity)
+
+
+def select_segments(offsets, pick, *flats):
+    """Takes some segments (trials) of ragged arrays, in the order of `pick`.
+    :param offsets: offsets of the segments
+    :param list pick: segment numbers
+    :returns: the new offsets and the selected values of each flat array
+    """
+
+    pick = np.asarray(pick, dtype=np.int64)
+    starts, lengths = offsets[:-1][pick], np.diff(offsets)[pick]
+    new_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    index = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return (new_offsets,) + tuple(flat[index] for flat in flats)
+
+
+def segment_ids(offsets):
+    """Segment (trial) number of each frame of the flat buffers."""
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def segment_first(mask, offsets):
+    """Index (in the flat buffer) of the first True value of each segment, -1 if none."""
+    hits = np.flatnonzero(mask)
+    position = np.searchsorted(hits, offsets[:-1])
+    first = np.full(len(offsets) - 1, -1, dtype=np.int64)
+    found = position < len(hits)
+    found[found] = hits[position[found]] < offsets[1:][found]
+    first[found] = hits[position[found]]
+    return first
+
+
+def segment_reduce(ufunc, values, offsets, empty=np.nan):
+    """`ufunc.reduceat` over each segment, with `empty` for empty segments."""
+    result = np.full(len(offsets) - 1, empty, dtype=float)
+    full = np.diff(offsets) > 0
+    if full.any():
+        result[full] = ufunc.reduceat(values, offsets[:-1][full])
+    return result
+
+
+def trajectory_metrics(path, times, offsets, resp=None, onset_distance=10, side_distance=20):
+    """Metrics of all trajectories at once.
+    :param path: flat (frames, 2) array of mouse positions
+    :param times: flat array of the times of the frames (s)
+    :param offsets: trial k is offsets[k]:offsets[k+1]
+    :param resp: 'l'/'r' response of each trial (optional, for changes of mind)
+    :param float onset_distance: distance from the first position that marks
+        the movement onset (px)
+    :param float side_distance: horizontal distance from the first position
+        beyond which the cursor is on a side (px)
+    :returns: dict of arrays with one value per trial: 'frames', 'onset'
+        (time of the movement onset), 'path_length', 'peak_speed' (px/s),
+        'peak_speed_time', 'max_deviation' (from the straight line between
+        the first and last positions), 'x_flips' (changes of side), 'initial_side'
+        ('l', 'r' or ''), 'change_of_mind' and 'change_of_mind_time'
+    """
+
+    path = np.asarray(path, dtype=float).reshape(-1, 2)
+    times = np.asarray(times, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n = len(offsets) - 1
+    starts, ends = offsets[:-1], offsets[1:]
+    full = ends > starts
+    ids = segment_ids(offsets)
+
+    # Position relative to the first position of the trial
+    first = path[np.where(full, starts, 0)] if len(path) else np.zeros((n, 2))
+    relative = path - first[ids]
+
+    # Steps between consecutive frames of the same trial
+    steps = np.diff(path, axis=0, prepend=path[:1])
+    dt = np.diff(times, prepend=times[:1])
+    steps[starts[full]] = 0  #no step into the first frame of a trial
+    dt[starts[full]] = 0
+    step_length = np.sqrt((steps ** 2).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(dt > 0, step_length / dt, 0)
+
+    metrics = {'frames'     : np.diff(offsets),
+               'path_length': segment_reduce(np.add, step_length, offsets, 0)}
+
+    onset = segment_first((relative ** 2).sum(axis=1) > onset_distance ** 2, offsets)
+    metrics['onset'] = np.where(onset >= 0, times[onset] - times[np.where(full, starts, 0)], np.nan)
+
+    peak_speed = segment_reduce(np.maximum, speed, offsets)
+    metrics['peak_speed'] = peak_speed
+    at_peak = segment_first(speed == np.nan_to_num(peak_speed)[ids], offsets)
+    metrics['peak_speed_time'] = np.where(full, times[at_peak] - times[np.where(full, starts, 0)], np.nan)
+
+    # Largest distance from the straight line between first and last positions
+    chord = path[np.where(full, ends - 1, 0)] - first
+    chord_length = np.sqrt((chord ** 2).sum(axis=1))
+    cross = np.abs(relative[:, 0] * chord[ids, 1] - relative[:, 1] * chord[ids, 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deviation = np.where(chord_length[ids] > 0, cross / chord_length[ids], 0)
+    metrics['max_deviation'] = segment_reduce(np.maximum, deviation, offsets)
+
+    # Side of the cursor (-1 left, 1 right, 0 in between) and its changes
+    side = np.sign(relative[:, 0]) * (np.abs(relative[:, 0]) > side_distance)
+    on_side = np.flatnonzero(side)
+    if len(on_side):
+        changed = np.concatenate(([False], (side[on_side][1:] != side[on_side][:-1])
+                                  & (ids[on_side][1:] == ids[on_side][:-1])))
+    else:
+        changed = np.zeros(0, dtype=bool)
+    metrics['x_flips'] = np.bincount(ids[on_side][changed], minlength=n)
+    initial = segment_first(side != 0, offsets)
+    initial_side = np.where(initial >= 0, side[initial], 0)
+    metrics['initial_side'] = np.array(['', 'r', 'l'])[initial_side.astype(int)]
+
+    if resp is not None:
+        resp_side = np.where(np.asarray(resp) == 'l', -1, np.where(np.asarray(resp) == 'r', 1, 0))
+        com = (initial_side != 0) & (resp_side != 0) & (initial_side != resp_side)
+        # First frame on the side of the response, after the initial side
+        reached = np.zeros(len(side), dtype=bool)
+        reached[on_side] = side[on_side] == resp_side[ids[on_side]]
+        com_frame = segment_first(reached & com[ids], offsets)
+        metrics['change_of_mind'] = com.astype(int)
+        metrics['change_of_mind_time'] = np.where(com_frame >= 0,
+                                                  times[com_frame] - times[np.where(full, starts, 0)], np.nan)
+    return metrics
+
+
+def analyse_file(filename, **settings):
+    """Trial information and trajectory metrics of one data file.
+    :param str filename: CSV file written by tokens.py
+    :param settings: keyword arguments of `trajectory_metrics`
+    :returns: dict of arrays with one value per trial
+    """
+
+    data = read_data(filename)
+    metrics = trajectory_metrics(data['path'], data['times'], data['offsets'],
+                                 resp=data.get('resp'), **settings)
+    trials = {'file': np.full(len(data['trial']), os.path.basename(filename))}
+    for name in 'id', 'trial', 'type', 'correct', 'resp', 'acc', 'rt':
+        if name in data:
+            trials[name] = data[name]
+    trials.update(metrics)
+    return trials
+
+
+def analyse_archive(filenames, processes=None, **settings):
+    """Analyses many data files, in parallel.
+    :param list filenames: CSV files written by tokens.py
+    :param int processes: number of worker processes (optional, default
+        one per CPU; 1 to analyse in this process)
+    :param settings: keyword arguments of `trajectory_metrics`
+    :returns: dict of arrays with one value per trial of all files
+    """
+
+    if processes == 1 or len(filenames) < 2:
+        results = [analyse_file(filename, **settings) for filename in filenames]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [pool.submit(analyse_file, filename, **settings) for filename in filenames]
+            results = [future.result() for future in futures]
+    if not results:
+        return {}
+    names = [name for name in results[0] if all(name in r for r in results)]
+    return {name: np.concatenate([r[name] for r in results]) for name in names}
+
+
+def write_metrics(metrics, filename):
+    """Writes the per-trial metrics as a CSV file."""
+    names = list(metrics)
+    with open(filename, 'w', newline='') as out_file:
+        out = csv.writer(out_file)
+        out.writerow(names)
+        out.writerows(zip(*[metrics[name].tolist() for name in names]))
+
+
+def data_files(patterns):
+    """Data files matching glob patterns, without the metrics files written
+    next to them (`*_metrics.csv`).
+    :param list patterns: glob patterns
+    """
+    return sorted({f for pattern in patterns for f in glob.glob(pattern)
+                   if not f.endswith('_metrics.csv')})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Trajectory metrics of the data files.')
+    parser.add_argument('files', nargs='*', default=['data/*.csv'], help='data files (glob patterns)')
+    parser.add_argument('--out', default='metrics.csv', help='CSV file for the metrics')
+    parser.add_argument('--processes', type=int, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    filenames = data_files(args.files)
+    metrics = analyse_archive(filenames, args.processes)
+    if metrics:
+        write_metrics(metrics, args.out)
+    print('%s trials from %s files' % (len(metrics.get('trial', [])), len(filenames)))
+
+
+if __name__ == '__main__':
+    main()
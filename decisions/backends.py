@@ -0,0 +1,29 @@
+import os
+
+"""
+Backends for the window, mouse, clocks and stimuli used by tokens.py.
+
+'psychopy' (default) is the real thing. 'headless' (see headless.py) runs
+the same session without a display, on a virtual clock, with a scripted
+mouse. The backend is chosen with the DECISIONS_BACKEND environment variable.
+"""
+
+BACKENDS = ('psychopy', 'headless')
+
+
+def load_backend(name=None):
+    """Returns the core, visual, event, logging, gui and data modules (or
+    their stand-ins) of a backend.
+    :param str name: 'psychopy' or 'headless' (optional, default from the
+        DECISIONS_BACKEND environment variable, or 'psychopy')
+    """
+
+    if name is None:
+        name = os.environ.get('DECISIONS_BACKEND', 'psychopy')
+    if name == 'psychopy':
+        from psychopy import core, visual, event, logging, gui, data
+    elif name == 'headless':
+        from .headless import core, visual, event, logging, gui, data
+    else:
+        raise ValueError('Unknown backend %r, use one of %s.' % (name, BACKENDS))
+    return core, visual, event, logging, gui, data
@@ -0,0 +1,171 @@
+import numpy as np
+from .tokentools import compile_template, path_tables
+
+"""
+Bulk sequence generation.
+
+Generates many sequences of one template at once as a uint8 array (one row per
+trial, 1 for a token moving right and 0 for a token moving left). The NR
+random walk of `make_NR_sequence` runs vectorized across all trials.
+"""
+
+# Byte codes used to convert arrays to text sequences: [left, right]
+CODES = {'letters': np.frombuffer(b'lr', dtype=np.uint8),
+         'digits' : np.frombuffer(b'12', dtype=np.uint8)}
+
+
+def make_NR_batch(filled_ranges, n, rng=None):
+    """Vectorized `make_NR_sequence`: n NR sequences as an array of shape
+    (n, num_tokens), following the same walk rules for every trial at once.
+    :params list filled_ranges: list with ranges from compile_template()
+    :params int n: number of sequences
+    :params rng: a numpy Generator (optional)
+    """
+
+    if rng is None: rng = np.random.default_rng()
+    num_tokens = len(filled_ranges)
+    nr_batch = np.zeros((n, num_tokens), dtype=np.int64)
+    value = np.zeros(n, dtype=np.int64)
+    for i, (low, high) in enumerate(filled_ranges):
+        if low == high:
+            value = np.full(n, low, dtype=np.int64)
+        elif i == 0:
+            value = rng.integers(0, 2, size=n)
+        else:
+            previous_value = nr_batch[:, i-1]
+            value = previous_value.copy()
+            # If previous value is lower than the current minimum, mandatory to add 1
+            value[previous_value == low - 1] += 1
+            # If previous value is within the current range, then it's a coin toss
+            in_range = (previous_value >= low) & (previous_value < high)
+            value[in_range] += rng.integers(0, 2, size=np.count_nonzero(in_range))
+        nr_batch[:, i] = value
+    return nr_batch
+
+
+def sample_NR_batch(filled_ranges, n, p_right=.5, rng=None):
+    """Vectorized `sample_NR_sequence`: n NR sequences drawn uniformly from
+    the valid paths through `filled_ranges` (or weighted by p_right per right
+    step), as an array of shape (n, num_tokens).
+    :params tuple filled_ranges: tuple with ranges from compile_template()
+    :params int n: number of sequences
+    :params float p_right: weight of a right step (optional, default .5)
+    :params rng: a numpy Generator (optional)
+    """
+
+    if rng is None: rng = np.random.default_rng()
+    up_tables = path_tables(tuple(tuple(x) for x in filled_ranges), p_right)
+    nr_batch = np.zeros((n, len(up_tables)), dtype=np.int64)
+    value = np.zeros(n, dtype=np.int64)
+    coins = rng.random((n, len(up_tables)))
+    for i, (offset, up_probs) in enumerate(up_tables):
+        value = value + (coins[:, i] < up_probs[value - offset])
+        nr_batch[:, i] = value
+    return nr_batch
+
+
+def nr_to_moves(nr_batch):
+    """Converts NR sequences to token movements (1 = right, 0 = left).
+    :params nr_batch: array of NR sequences, one per row
+    """
+
+    nr_batch = np.atleast_2d(nr_batch)
+    return (np.diff(nr_batch, axis=1, prepend=0) == 1).astype(np.uint8)
+
+
+def generate_batch(template, t_type, num_tokens, n, winning_sides=None, rng=None):
+    """Generates n sequences of one template as an array of shape
+    (n, num_tokens), 1 for right and 0 for left.
+    :param list template: a list of min_p_r, max_p_r tuples
+    :param str t_type: the type of trial ('e', 'a' or 'm')
+    :param int num_tokens: the number of tokens
+    :param int n: number of sequences
+    :param winning_sides: 'l'/'r' per sequence (optional, default all 'r')
+    :param rng: a numpy Generator (optional)
+    :raises ValueError: if no sequence of num_tokens tokens fits the template
+    """
+
+    filled_ranges = compile_template(template, t_type, num_tokens)
+    nr_batch = sample_NR_batch(filled_ranges, n, rng=rng)
+    moves = nr_to_moves(nr_batch)
+    # By default all sequences are made with Right side winning.
+    if winning_sides is not None:
+        left = np.asarray(winning_sides) == 'l'
+        moves[left] = 1 - moves[left]
+    return moves
+
+
+def batch_to_text(moves, format_to='letters'):
+    """Converts an array of movements to a list of text sequences.
+    :param moves: array of shape (n, num_tokens), 1 = right, 0 = left
+    :param str format_to: 'letters' (default) or 'digits'
+    """
+
+    moves = np.atleast_2d(moves)
+    text = CODES[format_to][moves].tobytes().decode('ascii')
+    length = moves.shape[1]
+    return [text[i:i+length] for i in range(0, len(text), length)]
+
+
+def batch_winning_side(moves, format_to='letters'):
+    """Winning side of each sequence, as in `winning_side` (ties go right).
+    :param moves: array of shape (n, num_tokens), 1 = right, 0 = left
+    :param str format_to: 'letters' (default) or 'digits'
+    """
+
+    moves = np.atleast_2d(moves)
+    nr_left = moves.shape[1] - moves.sum(axis=1)
+    left_wins = nr_left > moves.shape[1] - nr_left
+    code_left, code_right = CODES[format_to].tobytes().decode('ascii')
+    return [code_left if x else code_right for x in left_wins]
+
+
+def batch_experiment_sequences(templates, num_tokens, nr_per_type, nr_random=0,
+    randomisation='random', format_to='letters', rng=None):
+    """Same trial list as `experiment_sequences`, with all the sequences of
+    each trial type generated in a single batch.
+
+    :params dict templates: a dictionary with trial_type as key and the template (list of tuples) as value
+    :params int num_tokens: the number of tokens (the length of the sequence)
+    :params int nr_per_type: number of repetitions of each template
+    :params int nr_random: number of trials sampled randomly from the templates
+    :params str randomisation: whether trials are shuffled ('random') or not
+    :params str format_to: 'letters' (default) or 'digits'
+    :params rng: a numpy Generator (optional)
+    """
+
+    if rng is None: rng = np.random.default_rng()
+
+    trial_keys = []
+    for trial_type in templates:
+        trial_keys += [trial_type] * nr_per_type
+    # Add random sequences
+    keys = list(templates)
+    trial_keys += [keys[i] for i in rng.integers(0, len(keys), size=nr_random)]
+
+    # For the whole experiment, set 1/2 trials to Left-winning, and 1/2 to Right-winning
+    nr_l = round(len(trial_keys) / 2)
+    nr_r = len(trial_keys) - nr_l
+    exp_winning_side = rng.permutation(np.array(['l'] * nr_l + ['r'] * nr_r))
+    trial_keys = np.array(trial_keys)
+
+    # One batch per trial type
+    exp_sequences = [None] * len(trial_keys)
+    for trial_type in templates:
+        trials = np.flatnonzero(trial_keys == trial_type)
+        if len(trials) == 0:
+            continue
+        moves = generate_batch(templates[trial_type], trial_type[0], num_tokens,
+                               len(trials), exp_winning_side[trials], rng)
+        text_sequences = batch_to_text(moves, format_to)
+        sides = batch_winning_side(moves, format_to)
+        for trl, text_sequence, side in zip(trials, text_sequences, sides):
+            exp_sequences[trl] = {'trial_type'     : trial_type,
+                                  'token_sequence' : text_sequence,
+                                  'winning_side'   : side}
+
+    # Re-order according to need
+    if randomisation == 'random':
+        exp_sequences = [exp_sequences[i] for i in rng.permutation(len(exp_sequences))]
+
+    return exp_sequences
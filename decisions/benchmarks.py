@@ -0,0 +1,352 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import datetime
+import random
+import numpy as np
+from collections import Counter
+from fractions import Fraction
+from functools import lru_cache
+from math import comb
+from .tokentools import *
+from .probtable import binomial_cdf, prob_right
+from .batchtools import batch_experiment_sequences, sample_NR_batch
+from .visualtools import create_coordinates, create_coordinates_batch
+from .ordering import order_conditions, order_summary
+from .settings import TEMPLATES, grid_settings
+
+"""
+Benchmarks for the sequence generation and token layout code.
+
+Runs without PsychoPy. Each benchmark is timed over a sweep of num_tokens and
+session sizes, and the faster code paths are cross-checked against the
+reference functions. The start-up time of the imports and commands that do
+not show anything is timed too. Results are saved as JSON so that runs on
+different commits can be compared:
+
+    decisions benchmark --out bench.json
+    decisions benchmark --quick --compare bench.json
+"""
+
+NUM_TOKENS = [15, 25, 50, 100, 200, 500, 1000]
+SESSION_SIZES = [100, 1000, 10000, 100000]
+QUICK_NUM_TOKENS = [15, 25, 100]
+QUICK_SESSION_SIZES = [100, 1000]
+# Largest number of token positions (trials x num_tokens) generated at once
+MAX_LAYOUT_TOKENS = 10**7
+# Commands timed from a new Python process (none of them should import PsychoPy)
+COLD_STARTS = [('python', 'pass'),
+               ('import decisions', 'import decisions'),
+               ('import decisions.tokentools', 'import decisions.tokentools'),
+               ('import decisions.bundle', 'import decisions.bundle'),
+               ('import decisions.analysis', 'import decisions.analysis'),
+               ('decisions generate --help', "from decisions.cli import main; main(['generate', '--help'])"),
+               ('decisions analyse --help', "from decisions.cli import main; main(['analyse', '--help'])")]
+
+
+def timed(function, repeat=3):
+    """Best time (s) of `repeat` calls of a function without arguments."""
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_sequences(n, num_tokens, rng):
+    """n random letter sequences."""
+    return [''.join(x) for x in rng.choice(['l', 'r'], size=(n, num_tokens))]
+
+
+def bench_generation(num_tokens, rng):
+    """Timings of the probability and sequence generation functions for one
+    num_tokens."""
+
+    results = []
+    def add(name, seconds, n=1, **extra):
+        results.append(dict(name=name, num_tokens=num_tokens, n=n, seconds=seconds,
+                            per_call=seconds / n, **extra))
+
+    clear_compiled_templates()
+    NCs = [int(x) for x in rng.integers(0, num_tokens + 1, 1000)]
+    NLs = [int(x) for x in rng.integers(0, num_tokens + 1, 1000)]
+    add('get_prob', timed(lambda: [get_prob(NC, NL, num_tokens) for NC, NL in zip(NCs, NLs)]), 1000)
+    if num_tokens <= 170:  #the direct formula overflows above
+        add('get_prob_formula', timed(lambda: [get_prob_formula(NC, NL, num_tokens)
+                                               for NC, NL in zip(NCs[:100], NLs[:100])]), 100)
+
+    add('prob_right', timed(lambda: prob_right(np.array(NCs), np.array(NLs), num_tokens)), 1000)
+
+    sequences = random_sequences(100, num_tokens, rng)
+    add('get_prob_vector', timed(lambda: [get_prob_vector(s, num_tokens) for s in sequences[:10]], 1), 10)
+    add('get_prob_matrix', timed(lambda: get_prob_matrix(sequences, num_tokens)), 100)
+
+    bands = [(float(a), float(b)) for a, b in np.sort(np.round(rng.random((100, 2)), 2), axis=1)]
+    def run_get_NL(function, bands):
+        for NC, (a, b) in zip(NCs, bands):
+            try: function(num_tokens, min(NC, num_tokens), a, b)
+            except ValueError: pass
+    add('get_NL', timed(lambda: run_get_NL(get_NL, bands)), 100)
+    add('get_NL_scan', timed(lambda: run_get_NL(get_NL_scan, bands[:10]), 1), 10)
+
+    for t_type, template in TEMPLATES.items():
+        extended = extend_template(template, t_type, num_tokens)
+        add('extend_template', timed(lambda: extend_template(template, t_type, num_tokens)), t_type=t_type)
+        add('get_ranges', timed(lambda: get_ranges(extended), 1), t_type=t_type)
+        ranges = get_ranges(extended)
+        add('fill_in', timed(lambda: fill_in(ranges), 1), t_type=t_type)
+        try:
+            add('propagate_ranges', timed(lambda: propagate_ranges(ranges), 1), t_type=t_type)
+        except ValueError:  #infeasible template
+            pass
+        filled_ranges = compile_template(template, t_type, num_tokens, strict=False)
+        add('make_NR_sequence', timed(lambda: [make_NR_sequence(filled_ranges) for i in range(10)]), 10,
+            t_type=t_type)
+        try:
+            path_tables(filled_ranges)
+            add('sample_NR_sequence', timed(lambda: [sample_NR_sequence(filled_ranges) for i in range(10)]),
+                10, t_type=t_type)
+            add('sample_NR_batch', timed(lambda: sample_NR_batch(filled_ranges, 1000, rng=rng)), 1000,
+                t_type=t_type)
+        except ValueError:  #no valid path through this template
+            pass
+    return results
+
+
+def bench_sessions(num_tokens, session_sizes, rng, max_seconds):
+    """Timings of full trial lists and layouts for each session size."""
+
+    results = []
+    loc, side_tokens, circle_radius, token_size = grid_settings(num_tokens)
+    skip = set()
+    for n in session_sizes:
+        nr_per_type = n // len(TEMPLATES)
+        cases = [('experiment_sequences', lambda: experiment_sequences(
+                      TEMPLATES, num_tokens, nr_per_type)),
+                 ('batch_experiment_sequences', lambda: batch_experiment_sequences(
+                      TEMPLATES, num_tokens, nr_per_type, rng=rng)),
+                 ('create_coordinates', lambda: [create_coordinates(
+                      loc, side_tokens, circle_radius, token_size, rng) for i in range(n)]),
+                 ('create_coordinates_batch', lambda: create_coordinates_batch(
+                      loc, side_tokens, circle_radius, token_size, n, num_tokens, rng))]
+        for name, function in cases:
+            if name in skip:
+                continue
+            if name.startswith('create_coordinates') and n * num_tokens > MAX_LAYOUT_TOKENS:
+                continue  #the layouts alone would not fit in memory
+            seconds = timed(function, 1)
+            results.append(dict(name=name, num_tokens=num_tokens, n=n, seconds=seconds,
+                                per_call=seconds / n))
+            if seconds > max_seconds:  #larger sessions would take too long
+                skip.add(name)
+    return results
+
+
+def cross_checks(num_tokens, rng):
+    """Compares the faster code paths with the reference functions.
+    :returns: list of dicts with the name of the check and whether it passed"""
+
+    checks = []
+    def check(name, ok, detail=''):
+        checks.append(dict(name=name, num_tokens=num_tokens, ok=bool(ok), detail=detail))
+
+    if num_tokens <= 170:
+        mismatches = [(NC, NL) for NC in range(num_tokens + 1) for NL in range(num_tokens + 1)
+                      if get_prob(NC, NL, num_tokens) != get_prob_formula(NC, NL, num_tokens)]
+        check('get_prob == get_prob_formula', not mismatches, str(mismatches[:5]))
+
+    errors = [abs(binomial_cdf(NC, bound) - float(Fraction(sum(comb(NC, k) for k in range(bound + 1)), 2**NC)))
+              for NC in rng.integers(0, num_tokens + 1, 20).tolist()
+              for bound in rng.integers(0, NC + 1, 5).tolist()]
+    check('binomial_cdf == exact binomial CDF', max(errors) < 1e-9, 'max error %.1e' % max(errors))
+
+    sequences = random_sequences(20, num_tokens, rng)
+    matrix = get_prob_matrix(sequences, num_tokens)
+    check('get_prob_matrix == get_prob_vector',
+          all(get_prob_vector(s, num_tokens) == row.tolist() for s, row in zip(sequences, matrix)))
+
+    mismatches = []
+    for NC in rng.integers(0, num_tokens + 1, 20):
+        for a, b in np.sort(np.round(rng.random((10, 2)), 2), axis=1):
+            try: reference = get_NL_scan(num_tokens, int(NC), a, b)
+            except ValueError: reference = None
+            if get_NL_range(num_tokens, int(NC), a, b) != reference:
+                mismatches.append((int(NC), a, b))
+    check('get_NL_range == get_NL_scan', not mismatches, str(mismatches[:5]))
+
+    for t_type, template in TEMPLATES.items():
+        filled_ranges = compile_template(template, t_type, num_tokens, strict=False)
+        reference = fill_in(get_ranges(extend_template(template, t_type, num_tokens)))
+        check('compile_template within fill_in(get_ranges(extend_template)) (%s)' % t_type,
+              all(a >= c and b <= d for (a, b), (c, d) in zip(filled_ranges, reference)))
+        try:
+            nr_batch = sample_NR_batch(filled_ranges, 200, rng=rng)
+        except ValueError as error:  #no valid path: nothing to compare
+            check('sample_NR_batch stays within ranges (%s)' % t_type, True, str(error))
+            continue
+        low, high = np.array(filled_ranges).T
+        steps = np.diff(nr_batch, axis=1, prepend=0)
+        check('sample_NR_batch stays within ranges (%s)' % t_type,
+              ((nr_batch >= low) & (nr_batch <= high)).all() and np.isin(steps, (0, 1)).all())
+        moves = make_sequence([int(x) for x in nr_batch[0]])
+        check('make_sequence of sampled NR has NR right moves (%s)' % t_type,
+              moves.count('r') == nr_batch[0, -1])
+
+    loc, side_tokens, circle_radius, token_size = grid_settings(num_tokens)
+    batch = create_coordinates_batch(loc, side_tokens, circle_radius, token_size, 50, num_tokens, rng)
+    radius = np.sqrt((batch ** 2).sum(axis=2))
+    check('create_coordinates_batch inside the circle',
+          batch.shape == (50, num_tokens, 2) and (radius <= circle_radius).all())
+    return checks
+
+
+def has_order(conditions, max_type_run, max_side_run):
+    """Whether some order of the conditions meets the run limits, by an
+    exhaustive search (reference for `order_conditions`, small sets only)."""
+
+    classes = sorted(set(conditions))
+    counts = Counter(conditions)
+
+    @lru_cache(maxsize=None)
+    def search(remaining, last_type, type_run, last_side, side_run):
+        if not any(remaining):
+            return True
+        for k, (trial_type, side) in enumerate(classes):
+            new_type_run = type_run + 1 if trial_type == last_type else 1
+            new_side_run = side_run + 1 if side == last_side else 1
+            if remaining[k] and new_type_run <= max_type_run and new_side_run <= max_side_run:
+                rest = remaining[:k] + (remaining[k] - 1,) + remaining[k+1:]
+                if search(rest, trial_type, new_type_run, side, new_side_run):
+                    return True
+        return False
+    return search(tuple(counts[c] for c in classes), None, 0, None, 0)
+
+
+def order_checks(rng, seeds=20):
+    """`order_conditions` orders every balanced set of conditions that has a
+    valid order, within the limits, including at the strictest limits."""
+
+    checks = []
+    for trial_types in 'ea', 'eam':
+        for repeats in 1, 2, 3, 20:
+            conditions = [(t, s) for t in trial_types for s in 'lr'] * repeats
+            for limits in (1, 1), (1, 2), (2, 1), (2, 2), (3, 3):
+                if repeats <= 3:
+                    expected = has_order(conditions, *limits)
+                else:  # too large to search, but they can only fail at runs of 1
+                    expected = len(trial_types) > 2 or limits != (1, 1)
+                failures = []
+                for seed in rng.integers(0, 2**32, seeds).tolist():
+                    try:
+                        order = order_conditions(conditions, *limits, rng=np.random.default_rng(seed))
+                        summary = order_summary(order)
+                        ok = (Counter(order) == Counter(conditions)
+                              and summary['longest_type_run'] <= limits[0]
+                              and summary['longest_side_run'] <= limits[1])
+                    except ValueError:
+                        ok = False
+                    if ok != expected:
+                        failures += [seed]
+                checks.append(dict(name='order_conditions of %s x %s at runs %s (%s)'
+                                   % (len(trial_types) * 2, repeats, limits, 'feasible' if expected else 'infeasible'),
+                                   num_tokens=None, ok=not failures, detail='seeds %s' % failures[:5]))
+    return checks
+
+
+def bench_cold_start(repeat=3):
+    """Timings of the COLD_STARTS commands, each in a new Python process.
+    :returns: the timings and the checks that PsychoPy was not imported"""
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results, checks = [], []
+    for name, code in COLD_STARTS:
+        code = ("import atexit, sys; atexit.register(lambda: print('psychopy' in sys.modules)); "
+                + code)
+        best, output = float('inf'), ''
+        for i in range(repeat):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True).stdout
+            best = min(best, time.perf_counter() - start)
+        results.append(dict(name='cold start: ' + name, num_tokens=None, n=1, seconds=best, per_call=best))
+        checks.append(dict(name='no PsychoPy import: ' + name, num_tokens=None,
+                           ok=output.decode().split()[-1:] == ['False'], detail=''))
+    return results, checks
+
+
+def git_commit():
+    """Current commit of the repository, if available."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    """Prints the ratio of each timing to the same timing in a previous run."""
+    old = {(r['name'], r['num_tokens'], r['n'], r.get('t_type')): r['per_call']
+           for r in previous['results']}
+    print('%-30s %10s %8s %5s %10s' % ('name', 'num_tokens', 'n', 'type', 'new/old'))
+    for r in results['results']:
+        key = (r['name'], r['num_tokens'], r['n'], r.get('t_type'))
+        if key in old and old[key] > 0:
+            print('%-30s %10s %8s %5s %10.2f' % (key[0], key[1], key[2], key[3] or '',
+                                                 r['per_call'] / old[key]))
+
+
+def run(num_tokens_list, session_sizes, max_seconds=10, seed=0):
+    """Runs all benchmarks and cross-checks.
+    :returns: dict ready to be saved as JSON"""
+
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    results = {'commit'  : git_commit(),
+               'date'    : datetime.datetime.now().isoformat(timespec='seconds'),
+               'python'  : platform.python_version(),
+               'numpy'   : np.__version__,
+               'results' : [],
+               'checks'  : []}
+    for num_tokens in num_tokens_list:
+        results['results'] += bench_generation(num_tokens, rng)
+        results['results'] += bench_sessions(num_tokens, session_sizes, rng, max_seconds)
+        results['checks'] += cross_checks(num_tokens, rng)
+    results['checks'] += order_checks(rng)
+    timings, checks = bench_cold_start()
+    results['results'] += timings
+    results['checks'] += checks
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the generation and layout code.')
+    parser.add_argument('--out', help='JSON file for the results')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare with')
+    parser.add_argument('--quick', action='store_true', help='smaller sweep')
+    parser.add_argument('--max-seconds', type=float, default=10,
+                        help='skip larger sessions once a case takes longer than this')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        results = run(QUICK_NUM_TOKENS, QUICK_SESSION_SIZES, args.max_seconds)
+    else:
+        results = run(NUM_TOKENS, SESSION_SIZES, args.max_seconds)
+
+    failed = [c for c in results['checks'] if not c['ok']]
+    print('%s timings, %s checks, %s failed' % (len(results['results']), len(results['checks']), len(failed)))
+    for c in failed:
+        print('FAILED: %s (num_tokens=%s) %s' % (c['name'], c['num_tokens'], c['detail']))
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            json.dump(results, out_file, indent=1)
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import numpy as np
+from .batchtools import batch_to_text
+from .seeding import session_entropy, generate_session
+from .pipeline import prepare_trial
+from .visualtools import token_settings
+
+"""
+Precompiled sessions.
+
+`compile_session` makes all the trials of a session offline and writes
+everything they need except the PsychoPy objects to a folder (a bundle):
+    sequences.npy  (trials, num_tokens) uint8 movements (1 = right)
+    probs.npy      (trials, num_tokens+1) p(r) trajectories
+    xys.npy        (trials, num_tokens, 2) token coordinates
+    order.npy      (trials, num_tokens) indices of the central array
+    masks.npy      (trials, 3, num_tokens+1, num_tokens) visibility of the
+                   tokens of the central, left and right arrays at each step
+    meta.json      session seed, settings, and the trial type, side, winning
+                   side and seed of each trial
+`load_session` opens a bundle memory-mapped (in milliseconds, nothing is read
+until used), and `session_trials` gives its trials in the form of
+`pipeline.prepare_trial`, so tokens.py can run a bundle instead of making the
+trials at startup (`check_session` makes sure it was compiled with the
+current settings, see settings.py). A bundle is the exact record of the
+stimuli of a session; `verify_session` recomputes its trials from their
+seeds to check it:
+
+    decisions generate sessions/p01 --num-tokens 25 --seed 1234
+"""
+
+# Order of the arrays in masks.npy
+MASK_SIDES = ('c', 'l', 'r')
+
+ARRAYS = ('sequences', 'probs', 'xys', 'order', 'masks')
+
+
+def compile_session(path, templates, num_tokens, nr_per_type, layout, nr_random=0, entropy=None,
+    max_type_run=3, max_side_run=3, processes=None):
+    """Makes all the trials of a session and writes them to a bundle.
+    :param str path: folder of the bundle (created if needed)
+    :params dict templates: a dictionary with trial_type as key and the template as value
+    :params int num_tokens: the number of tokens (the length of the sequences)
+    :params int nr_per_type: number of repetitions of each template
+    :param dict layout: layout settings, as in `pipeline.prepare_trial`
+    :params int nr_random: number of trials of randomly chosen types
+    :params int entropy: entropy of the session (optional, default new)
+    :params int max_type_run: longest run of the same trial type
+    :params int max_side_run: longest run of the same winning side
+    :params int processes: worker processes for the sequences (see `generate_session`)
+    :returns: the metadata of the bundle
+    """
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    entropy = session_entropy(entropy)
+    trials = [prepare_trial(trial, num_tokens, layout)
+              for trial in generate_session(templates, num_tokens, nr_per_type, nr_random, entropy,
+                                            max_type_run, max_side_run, 'letters', processes)]
+
+    arrays = {'sequences': np.array([[x == 'r' for x in t['token_sequence']] for t in trials], dtype=np.uint8),
+              'probs'    : np.array([t['probs'] for t in trials]),
+              'xys'      : np.array([t['xys'] for t in trials]),
+              'order'    : np.array([t['stgs']['c']['i_all'] for t in trials], dtype=np.int32),
+              'masks'    : np.array([[t['masks'][side] for side in MASK_SIDES] for t in trials])}
+    for name in ARRAYS:
+        np.save(path + os.path.sep + name + '.npy', arrays[name])
+
+    meta = {'num_tokens'  : num_tokens,
+            'num_trials'  : len(trials),
+            'session_seed': entropy,
+            'templates'   : templates,
+            'nr_per_type' : nr_per_type,
+            'nr_random'   : nr_random,
+            'max_type_run': max_type_run,
+            'max_side_run': max_side_run,
+            'layout'      : {key: np.asarray(value).tolist() if key in ('loc', 'token_size') else value
+                             for key, value in layout.items()},
+            'trial_type'  : [t['trial_type'] for t in trials],
+            'side'        : [t['side'] for t in trials],
+            'winning_side': [t['winning_side'] for t in trials],
+            'seed'        : [t['seed'] for t in trials]}
+    with open(path + os.path.sep + 'meta.json', 'w') as meta_file:
+        json.dump(meta, meta_file, indent=1)
+    return meta
+
+
+def load_session(path):
+    """Opens a bundle (memory-mapped, nothing is read until used).
+    :param str path: folder of the bundle
+    :returns: dict with the metadata and the memory-mapped arrays
+    """
+
+    with open(path + os.path.sep + 'meta.json', 'r') as meta_file:
+        bundle = json.load(meta_file)
+    bundle['templates'] = {t_type: [tuple(x) for x in template]
+                           for t_type, template in bundle['templates'].items()}
+    bundle['layout']['loc'] = np.array(bundle['layout']['loc'])
+    for name in ARRAYS:
+        bundle[name] = np.load(path + os.path.sep + name + '.npy', mmap_mode='r')
+    return bundle
+
+
+def check_session(bundle, templates, num_tokens, nr_per_type, layout, nr_random=0, max_type_run=3,
+    max_side_run=3):
+    """Checks that a bundle was made with the given templates, numbers of
+    trials, run limits and layout (see `compile_session`).
+    :raises ValueError: naming the settings that differ
+    """
+
+    different = [name for name, value in (('num_tokens', num_tokens), ('nr_per_type', nr_per_type),
+                                          ('nr_random', nr_random), ('max_type_run', max_type_run),
+                                          ('max_side_run', max_side_run)) if bundle[name] != value]
+    for t_type in sorted(set(templates) | set(bundle['templates'])):
+        if (t_type not in templates or t_type not in bundle['templates']
+                or [tuple(x) for x in templates[t_type]] != bundle['templates'][t_type]):
+            different += ['template %r' % t_type]
+    for key in sorted(set(layout) | set(bundle['layout'])):
+        if key not in layout or key not in bundle['layout']:
+            different += [key]
+        elif isinstance(layout[key], str) or isinstance(bundle['layout'][key], str):
+            if layout[key] != bundle['layout'][key]:
+                different += [key]
+        elif not np.allclose(layout[key], bundle['layout'][key]):
+            different += [key]
+    if different:
+        raise ValueError('The session bundle was made with other settings: %s.' % ', '.join(different))
+
+
+def session_trial(bundle, trl):
+    """A trial of a bundle, as made by `pipeline.prepare_trial`.
+    :param dict bundle: bundle from `load_session`
+    :param int trl: trial number
+    """
+
+    token_sequence = batch_to_text(bundle['sequences'][trl:trl+1], 'letters')[0]
+    layout = bundle['layout']
+    return {'trial_type'    : bundle['trial_type'][trl],
+            'token_sequence': token_sequence,
+            'winning_side'  : bundle['winning_side'][trl],
+            'seed'          : bundle['seed'][trl],
+            'side'          : bundle['side'][trl],
+            'probs'         : bundle['probs'][trl],
+            'xys'           : bundle['xys'][trl],
+            'stgs'          : token_settings(token_sequence, layout['loc'], layout['c_offset'],
+                                             order=bundle['order'][trl]),
+            'masks'         : dict(zip(MASK_SIDES, bundle['masks'][trl]))}
+
+
+def session_trials(bundle):
+    """Generator of the trials of a bundle, in order (see `session_trial`)."""
+    for trl in range(bundle['num_trials']):
+        yield session_trial(bundle, trl)
+
+
+def verify_session(bundle):
+    """Recomputes each trial of a bundle from its seed and compares it.
+    :param dict bundle: bundle from `load_session`
+    :returns: list of the trial numbers that differ
+    """
+
+    from .seeding import seeded_trial
+    different = []
+    for trl in range(bundle['num_trials']):
+        stored = session_trial(bundle, trl)
+        trial = seeded_trial(bundle['templates'], stored['trial_type'], bundle['num_tokens'],
+                             stored['side'], stored['seed'])
+        trial = prepare_trial(trial, bundle['num_tokens'], bundle['layout'])
+        same = (trial['token_sequence'] == stored['token_sequence']
+                and trial['winning_side'] == stored['winning_side']
+                and trial['stgs']['c']['i_all'] == stored['stgs']['c']['i_all']
+                and all(np.array_equal(trial[name], stored[name]) for name in ('probs', 'xys'))
+                and all(np.array_equal(trial['masks'][side], stored['masks'][side]) for side in MASK_SIDES))
+        if not same:
+            different += [trl]
+    return different
+
+
+def main(argv=None):
+    from .settings import (TEMPLATES, NUM_TOKENS, NR_PER_TYPE, NR_RANDOM, MAX_TYPE_RUN, MAX_SIDE_RUN,
+                           C_OFFSET, token_layout)
+    parser = argparse.ArgumentParser(description='Compile a session of tokens.py into a bundle.')
+    parser.add_argument('path', help='folder of the bundle')
+    parser.add_argument('--num-tokens', type=int, default=NUM_TOKENS)
+    parser.add_argument('--nr-per-type', type=int, default=NR_PER_TYPE)
+    parser.add_argument('--nr-random', type=int, default=NR_RANDOM)
+    parser.add_argument('--seed', type=int, help='entropy of the session (default: new)')
+    parser.add_argument('--layout', default='grid', choices=('grid', 'poisson'))
+    parser.add_argument('--c-offset', type=float, default=C_OFFSET)
+    parser.add_argument('--processes', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--verify', action='store_true', help='check an existing bundle instead')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        different = verify_session(load_session(args.path))
+        print('%s trials differ from their seeds%s' % (len(different), (': %s' % different) if different else ''))
+    else:
+        layout = token_layout(args.num_tokens, args.layout, c_offset=args.c_offset)
+        meta = compile_session(args.path, TEMPLATES, args.num_tokens, args.nr_per_type, layout,
+                               args.nr_random, args.seed, MAX_TYPE_RUN, MAX_SIDE_RUN, args.processes)
+        print('%s trials, session seed %s' % (meta['num_trials'], meta['session_seed']))
+
+
+if __name__ == '__main__':
+    main()
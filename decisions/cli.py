@@ -0,0 +1,59 @@
+import importlib
+import os
+import sys
+
+"""
+Command line of the package (see USAGE). Each command only imports its own
+module, so the commands that do not show anything never import PsychoPy.
+"""
+
+USAGE = """usage: decisions <command> [options]
+
+    generate   compile a session into a bundle (bundle.py)
+    run        run the experiment (tokens.py)
+    analyse    trajectory metrics of the data files (analysis.py)
+    fit        fit the decision models (models.py)
+    benchmark  benchmarks of the generation code (benchmarks.py)
+
+`decisions <command> --help` lists the options of a command."""
+
+# Command: (module, function)
+COMMANDS = {'generate' : ('bundle', 'main'),
+            'run'      : ('cli', 'run'),
+            'analyse'  : ('analysis', 'main'),
+            'fit'      : ('models', 'main'),
+            'benchmark': ('benchmarks', 'main')}
+
+
+def run(argv=None):
+    """Runs the experiment, with PsychoPy or headless (see headless.py)."""
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Run the experiment.')
+    parser.add_argument('--bundle', help='folder of a session bundle (see `decisions generate`)')
+    parser.add_argument('--headless', action='store_true', help='run without a display (see headless.py)')
+    args, headless_args = parser.parse_known_args(argv)
+
+    if args.bundle:
+        os.environ['DECISIONS_BUNDLE'] = args.bundle
+    if args.headless:
+        from .headless import main
+        main(['decisions.tokens'] + headless_args)
+    elif headless_args:
+        parser.error('unrecognized arguments: %s' % ' '.join(headless_args))
+    else:
+        import runpy
+        runpy.run_module('decisions.tokens', run_name='__main__', alter_sys=True)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in COMMANDS:
+        print(USAGE, file=sys.stderr)
+        return 0 if argv and argv[0] in ('-h', '--help') else 2
+    module, function = COMMANDS[argv[0]]
+    return getattr(importlib.import_module('.' + module, __package__), function)(argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import json
+import os
+import numpy as np
+from .batchtools import generate_batch, batch_to_text
+from .tokentools import sequences_to_array
+
+"""
+On-disk corpus of pre-generated token sequences.
+
+A corpus is a folder with:
+- `sequences.bin`: the sequences bit-packed, one bit per token (1 = right,
+  0 = left), one row of ceil(num_tokens/8) bytes per sequence
+- `trial_type.npy`, `winning_side.npy`, `seed.npy`: side-car columns (trial
+  type code, 0 = left / 1 = right winner, seed of the generating batch)
+- `order.npy`: row numbers sorted by (trial type, winning side)
+- `meta.json`: num_tokens, trial types, the offsets of each group in `order`
+  and the batches the rows were generated in
+
+A row is regenerated from its batch (see `regenerate_rows`): the batch gives
+the trial type, the requested winning side, the seed and the number of
+sequences passed to `generate_batch`, and the row is at `row - start` in it.
+
+Everything is memory-mapped when loaded, so opening a corpus of millions of
+sequences costs nothing and sampling k sequences of a group only reads k rows.
+"""
+
+SIDES = 'lr'
+
+
+def pack_sequences(moves):
+    """Bit-packs an array of movements (1 = right, 0 = left), one row per sequence.
+    :param moves: array of shape (n, num_tokens)
+    """
+    return np.packbits(np.atleast_2d(moves).astype(np.uint8), axis=1)
+
+
+def unpack_sequences(packed, num_tokens):
+    """Inverse of `pack_sequences`.
+    :param packed: array of shape (n, ceil(num_tokens/8))
+    :param int num_tokens: the number of tokens
+    """
+    return np.unpackbits(np.atleast_2d(packed), axis=1, count=num_tokens)
+
+
+def text_to_packed(sequences):
+    """Bit-packs text sequences (letters or digits, as from `make_sequence`).
+    :param list sequences: text sequences of equal length
+    """
+    return pack_sequences(sequences_to_array(sequences))
+
+
+def packed_to_text(packed, num_tokens, format_to='letters'):
+    """Converts bit-packed sequences back to text sequences.
+    :param packed: array of shape (n, ceil(num_tokens/8))
+    :param int num_tokens: the number of tokens
+    :param str format_to: 'letters' (default) or 'digits'
+    """
+    return batch_to_text(unpack_sequences(packed, num_tokens), format_to)
+
+
+def build_corpus(path, templates, num_tokens, n_per_type, chunk_size=100000, seed=None):
+    """Generates a corpus of sequences and writes it to disk. Each trial type
+    gets n_per_type sequences, half of them Left-winning, half Right-winning,
+    generated in batches of at most `chunk_size` sequences.
+    :param str path: folder of the corpus (created if needed)
+    :param dict templates: a dictionary with trial_type as key and the template (list of tuples) as value
+    :param int num_tokens: the number of tokens (the length of the sequences)
+    :param int n_per_type: number of sequences of each trial type
+    :param int chunk_size: largest batch generated at once
+    :param int seed: seed of the corpus (optional)
+    """
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    trial_types = list(templates)
+    seeds = np.random.SeedSequence(seed)
+
+    columns = {'trial_type': [], 'winning_side': [], 'seed': []}
+    batches = []
+    row = 0
+    with open(path + os.path.sep + 'sequences.bin', 'wb') as bin_file:
+        for code, trial_type in enumerate(trial_types):
+            nr_l = n_per_type // 2
+            for side, n_side in ('l', nr_l), ('r', n_per_type - nr_l):
+                for start in range(0, n_side, chunk_size):
+                    n = min(chunk_size, n_side - start)
+                    chunk_seed = int(seeds.spawn(1)[0].generate_state(1, np.uint64)[0])
+                    moves = generate_batch(templates[trial_type], trial_type[0], num_tokens,
+                                           n, [side] * n, np.random.default_rng(chunk_seed))
+                    bin_file.write(pack_sequences(moves).tobytes())
+                    # Actual winner of each sequence (ties go right, as in `winning_side`)
+                    right_wins = 2 * moves.sum(axis=1) >= num_tokens
+                    columns['trial_type'] += [np.full(n, code, dtype=np.uint8)]
+                    columns['winning_side'] += [right_wins.astype(np.uint8)]
+                    columns['seed'] += [np.full(n, chunk_seed, dtype=np.uint64)]
+                    batches.append({'trial_type': trial_type, 'side': side, 'seed': chunk_seed,
+                                    'start': row, 'n': n})
+                    row += n
+
+    for name in columns:
+        columns[name] = np.concatenate(columns[name])
+        np.save(path + os.path.sep + name + '.npy', columns[name])
+    write_index(path, columns['trial_type'], columns['winning_side'], num_tokens, trial_types,
+                batches)
+
+
+def write_index(path, trial_type, winning_side, num_tokens, trial_types, batches=None):
+    """Writes the group index and the metadata of a corpus.
+    :param str path: folder of the corpus
+    :param trial_type: trial type code of each row
+    :param winning_side: winning side of each row (0 = left, 1 = right)
+    :param int num_tokens: the number of tokens
+    :param list trial_types: names of the trial types (index = code)
+    :param list batches: trial_type, side, seed, start and n of each generated batch (optional)
+    """
+
+    group = trial_type.astype(np.int64) * 2 + winning_side
+    order = np.argsort(group, kind='stable')
+    offsets = np.searchsorted(group[order], np.arange(len(trial_types) * 2 + 1))
+    np.save(path + os.path.sep + 'order.npy', order)
+    meta = {'num_tokens' : num_tokens,
+            'row_bytes'  : (num_tokens + 7) // 8,
+            'n'          : len(group),
+            'trial_types': trial_types,
+            'offsets'    : offsets.tolist(),
+            'batches'    : batches or []}
+    with open(path + os.path.sep + 'meta.json', 'w') as meta_file:
+        json.dump(meta, meta_file)
+
+
+def load_corpus(path):
+    """Opens a corpus (memory-mapped, nothing is read until used).
+    :param str path: folder of the corpus
+    :returns: dict with the metadata and the memory-mapped columns
+    """
+
+    with open(path + os.path.sep + 'meta.json', 'r') as meta_file:
+        corpus = json.load(meta_file)
+    corpus['sequences'] = np.memmap(path + os.path.sep + 'sequences.bin', dtype=np.uint8,
+                                    mode='r', shape=(corpus['n'], corpus['row_bytes']))
+    for name in 'trial_type', 'winning_side', 'seed', 'order':
+        corpus[name] = np.load(path + os.path.sep + name + '.npy', mmap_mode='r')
+    return corpus
+
+
+def regenerate_rows(corpus, templates, rows):
+    """Generates again the given rows of a corpus from the seeds of their
+    batches (they match the stored sequences).
+    :param dict corpus: corpus from `load_corpus`
+    :param dict templates: the templates the corpus was built with
+    :param rows: row numbers
+    :returns: array of movements, one row per requested row
+    """
+
+    batches = corpus.get('batches')
+    if not batches:
+        raise ValueError('The corpus has no batch records, its rows cannot be regenerated.')
+    starts = np.array([batch['start'] for batch in batches])
+    rows = np.atleast_1d(rows)
+    row_batches = np.searchsorted(starts, rows, side='right') - 1
+    moves = np.empty((len(rows), corpus['num_tokens']), dtype=np.uint8)
+    for b in np.unique(row_batches):
+        batch = batches[b]
+        in_batch = row_batches == b
+        batch_moves = generate_batch(templates[batch['trial_type']], batch['trial_type'][0],
+                                     corpus['num_tokens'], batch['n'], [batch['side']] * batch['n'],
+                                     np.random.default_rng(batch['seed']))
+        moves[in_batch] = batch_moves[rows[in_batch] - batch['start']]
+    return moves
+
+
+def sample_corpus(corpus, trial_type, side, k, format_to=None, rng=None):
+    """Draws k different sequences of a given trial type and winning side.
+    :param dict corpus: corpus from `load_corpus`
+    :param str trial_type: the type of trial
+    :param str side: the winning side, 'l' or 'r'
+    :param int k: number of sequences
+    :param str format_to: None for an array of movements (default), 'letters' or 'digits'
+    :param rng: a numpy Generator (optional)
+    """
+
+    if rng is None: rng = np.random.default_rng()
+    group = corpus['trial_types'].index(trial_type) * 2 + SIDES.index(side)
+    start, end = corpus['offsets'][group], corpus['offsets'][group+1]
+    if k > end - start:
+        raise ValueError('Only %s sequences of type %s winning %s in the corpus.'
+                         % (end - start, trial_type, side))
+    rows = corpus['order'][start + rng.choice(end - start, size=k, replace=False)]
+    packed = corpus['sequences'][rows]
+    if format_to is None:
+        return unpack_sequences(packed, corpus['num_tokens'])
+    return packed_to_text(packed, corpus['num_tokens'], format_to)
@@ -0,0 +1,131 @@
+import json
+import time
+import numpy as np
+
+"""
+Frame-timing instrumentation for the trial loop.
+
+Each frame, `mark` stores the time spent since the previous mark in a
+preallocated (frames x phases) array, and `end_frame` (right after
+win.flip()) stores the flip-to-flip interval. A frame is dropped when the
+interval is longer than 1.5 refresh periods, and overruns when the work
+before the flip takes longer than one refresh period. Per-trial reports and
+a session histogram of the intervals are written as JSON next to the data.
+"""
+
+# Default phases of a frame, in the order of the frame loop
+PHASES = ('area', 'mouse', 'cursor', 'tokens', 'response', 'flip')
+
+
+def new_frame_timer(max_frames, refresh_rate, phases=PHASES, bin_ms=.5):
+    """Creates a frame timer for trials of up to `max_frames` frames (frames
+    beyond that are counted in the report but their phases are not stored).
+    :param int max_frames: number of frames to allocate
+    :param float refresh_rate: screen refresh rate (Hz)
+    :param tuple phases: names of the phases of a frame
+    :param float bin_ms: width of the histogram bins (ms)
+    """
+
+    budget = 1000 / refresh_rate  #ms
+    bin_edges = np.arange(0, 4 * budget + bin_ms, bin_ms)
+    return {'phases'   : phases,
+            'index'    : {phase: i for i, phase in enumerate(phases)},
+            'budget'   : budget,
+            'durations': np.zeros((max_frames, len(phases))),  #ms
+            'intervals': np.full(max_frames, np.nan),  #flip to flip, ms
+            'frame'    : 0,
+            'last'     : None,  #time of the last mark
+            'last_flip': None,
+            'bin_edges': bin_edges,
+            'session'  : np.zeros(len(bin_edges), dtype=np.int64),  #last bin: longer
+            'trials'   : []}
+
+
+def start_trial(timer):
+    """Starts the timing of a new trial."""
+    timer['frame'] = 0
+    timer['last_flip'] = None
+    timer['durations'][:] = 0
+    timer['intervals'][:] = np.nan
+
+
+def start_frame(timer):
+    """Starts the timing of a frame (a frame that is not ended with
+    `end_frame` is overwritten by the next one)."""
+    frame = timer['frame']
+    if frame < len(timer['durations']):
+        timer['durations'][frame] = 0
+    timer['last'] = time.perf_counter()
+
+
+def mark(timer, phase):
+    """Adds the time since the previous mark to a phase of the current frame.
+    :param str phase: name of the phase that just ended
+    """
+
+    now = time.perf_counter()
+    frame = timer['frame']
+    if frame < len(timer['durations']):
+        timer['durations'][frame, timer['index'][phase]] += (now - timer['last']) * 1000
+    timer['last'] = now
+
+
+def end_frame(timer):
+    """Ends a frame, right after the flip (also marks the 'flip' phase)."""
+
+    mark(timer, 'flip')
+    frame = timer['frame']
+    if timer['last_flip'] is not None and frame < len(timer['intervals']):
+        timer['intervals'][frame] = (timer['last'] - timer['last_flip']) * 1000
+    timer['last_flip'] = timer['last']
+    timer['frame'] = frame + 1
+
+
+def trial_report(timer, trial):
+    """Summary of the frame timing of the current trial, also added to the
+    session histogram.
+    :param int trial: trial number
+    :returns: dict with the counts and indices of frames, dropped frames and
+        overruns, mean and max time of each phase (ms) and the interval histogram
+    """
+
+    n = min(timer['frame'], len(timer['intervals']))
+    durations = timer['durations'][:n]
+    work = durations[:, [i for i, p in enumerate(timer['phases']) if p != 'flip']].sum(axis=1)
+    dropped = np.flatnonzero(timer['intervals'][:n] > 1.5 * timer['budget'])  #NaN: not dropped
+    overruns = np.flatnonzero(work > timer['budget'])
+    intervals = timer['intervals'][:n]
+    intervals = intervals[~np.isnan(intervals)]
+    histogram = np.bincount(np.searchsorted(timer['bin_edges'], intervals, side='right') - 1,
+                            minlength=len(timer['bin_edges']))
+    timer['session'] += histogram
+    report = {'trial'    : trial,
+              'frames'   : timer['frame'],
+              'dropped'  : len(dropped),
+              'overruns' : len(overruns),
+              'dropped_frames' : dropped.tolist(),
+              'overrun_frames' : overruns.tolist(),
+              'max_interval_ms': float(intervals.max()) if len(intervals) else None,
+              'phase_mean_ms': dict(zip(timer['phases'], np.round(durations.mean(axis=0), 4).tolist()))
+                               if n else {},
+              'phase_max_ms' : dict(zip(timer['phases'], np.round(durations.max(axis=0), 4).tolist()))
+                               if n else {},
+              'histogram': histogram.tolist()}
+    timer['trials'] += [report]
+    return report
+
+
+def write_timing_report(timer, filename):
+    """Writes the per-trial reports and the session histogram as JSON.
+    :param str filename: e.g. the data file name with '_timing.json'
+    """
+
+    report = {'budget_ms'   : timer['budget'],
+              'bin_edges_ms': timer['bin_edges'].tolist(),  #last bin: longer intervals
+              'session'     : {'frames'   : sum(t['frames'] for t in timer['trials']),
+                               'dropped'  : sum(t['dropped'] for t in timer['trials']),
+                               'overruns' : sum(t['overruns'] for t in timer['trials']),
+                               'histogram': timer['session'].tolist()},
+              'trials'      : timer['trials']}
+    with open(filename, 'w') as timing_file:
+        json.dump(report, timing_file)
@@ -0,0 +1,226 @@
+import sys
+import time
+import numpy as np
+from types import SimpleNamespace
+
+"""
+Headless stand-in for the parts of PsychoPy used by tokens.py.
+
+Nothing is displayed: `Window.flip` advances a virtual clock by one refresh
+period, and the mouse follows a scripted or model-generated trajectory of
+that virtual time. The whole session (frame, token and trial loops and the
+data files) therefore runs faster than real time, without a display, e.g.
+to profile the trial loop or to check the output files.
+
+A trajectory is a function of (trial, t) that returns the (x, y) mouse
+position, t being the time since the start of the trial (the
+`mouse.clickReset()` call at the top of each trial).
+"""
+
+# State shared by the stand-ins (one session at a time)
+_state = {'refresh_rate': 60,
+          'now'         : 0.,  #virtual time (s)
+          'trial'       : -1,
+          'trial_start' : 0.,
+          'trajectory'  : None,
+          'flips'       : 0,
+          'draws'       : 0}
+
+
+def straight_trajectory(start=(0, -400), targets=((-200, 400), (200, 400)),
+                        delay=.3, duration=1.5, sides=None, seed=None):
+    """A scripted participant: waits at the start position for `delay`
+    seconds, then moves in a straight line to one of the side circles in
+    `duration` seconds, and stays there.
+    :param tuple start: start position (the pre-trial start shape)
+    :param tuple targets: positions of the left and right circles
+    :param float delay: time before the movement starts (s)
+    :param float duration: duration of the movement (s)
+    :param list sides: 'l'/'r' chosen in each trial (optional, default random)
+    :param int seed: seed of the random sides (optional)
+    """
+
+    rng = np.random.default_rng(seed)
+    chosen = {}
+
+    def trajectory(trial, t):
+        if trial not in chosen:
+            chosen[trial] = sides[trial % len(sides)] if sides else 'lr'[rng.integers(2)]
+        target = targets[0] if chosen[trial] == 'l' else targets[1]
+        progress = min(max((t - delay) / duration, 0), 1)
+        return (start[0] + (target[0] - start[0]) * progress,
+                start[1] + (target[1] - start[1]) * progress)
+    return trajectory
+
+
+def configure(trajectory=None, refresh_rate=60):
+    """Sets up a new headless session.
+    :param trajectory: function (trial, t) -> (x, y) (optional, default `straight_trajectory()`)
+    :param float refresh_rate: virtual refresh rate (Hz)
+    """
+
+    _state.update(refresh_rate=refresh_rate, now=0., trial=-1, trial_start=0.,
+                  trajectory=trajectory or straight_trajectory(), flips=0, draws=0)
+
+
+def stats():
+    """Virtual duration and number of flips and draws of the session."""
+    return {'virtual_time': _state['now'], 'flips': _state['flips'], 'draws': _state['draws']}
+
+
+#------
+# core
+#------
+
+class Clock:
+    """Clock on the virtual time."""
+    def __init__(self):
+        self._start = _state['now']
+    def getTime(self):
+        return _state['now'] - self._start
+    def reset(self, newT=0.):
+        self._start = _state['now'] + newT
+
+
+def _quit():
+    sys.exit(0)
+
+
+core = SimpleNamespace(Clock=Clock, quit=_quit, getAbsTime=time.time, wait=lambda secs: None)
+
+
+#--------
+# visual
+#--------
+
+class Window:
+    def __init__(self, size=(800, 600), **kwargs):
+        self.size = size
+        self.__dict__.update(kwargs)
+    def flip(self, clearBuffer=True):
+        _state['now'] += 1 / _state['refresh_rate']
+        _state['flips'] += 1
+    def close(self):
+        pass
+
+
+class _Stim:
+    """Generic stimulus: keeps its attributes and accepts any setX() call."""
+    def __init__(self, win, **kwargs):
+        self.win = win
+        self.pos = (0, 0)
+        self.__dict__.update(kwargs)
+    def __getattr__(self, name):
+        if name.startswith('set') and len(name) > 3:
+            attribute = name[3].lower() + name[4:]
+            return lambda value, *args, **kwargs: setattr(self, attribute, value)
+        raise AttributeError(name)
+    def draw(self):
+        _state['draws'] += 1
+    def contains(self, x, y=None):
+        """Whether a point (or the mouse) is within `radius` of the stimulus."""
+        if y is None:
+            x, y = x.getPos() if hasattr(x, 'getPos') else x
+        radius = getattr(self, 'radius', 0)
+        return (x - self.pos[0])**2 + (y - self.pos[1])**2 <= radius**2
+
+
+visual = SimpleNamespace(Window=Window, Circle=_Stim, Rect=_Stim, Polygon=_Stim,
+                         TextStim=_Stim, ElementArrayStim=_Stim)
+
+
+#-------
+# event
+#-------
+
+class Mouse:
+    """Mouse that follows the trajectory of the session. `clickReset()`
+    marks the start of a new trial."""
+    def __init__(self, visible=True, win=None):
+        self.visible = visible
+    def getPos(self):
+        t = _state['now'] - _state['trial_start']
+        return np.array(_state['trajectory'](_state['trial'], t), dtype=float)
+    def clickReset(self):
+        _state['trial'] += 1
+        _state['trial_start'] = _state['now']
+    def setPos(self, newPos=(0, 0)):
+        pass
+
+
+event = SimpleNamespace(Mouse=Mouse, getKeys=lambda keyList=None: [],
+                        waitKeys=lambda keyList=None, **kwargs: [keyList[0] if keyList else 'space'])
+
+
+#-----------------------
+# gui, data and logging
+#-----------------------
+
+class Dlg:
+    """Dialog that returns the initial value (or first choice) of each field."""
+    def __init__(self, title='', **kwargs):
+        self.fields = []
+        self.OK = True
+    def addField(self, label='', initial='', choices=None, **kwargs):
+        self.fields += [initial if choices is None or initial in choices else choices[0]]
+    def show(self):
+        return list(self.fields)
+
+
+gui = SimpleNamespace(Dlg=Dlg)
+data = SimpleNamespace(getDateStr=lambda format='%Y-%m-%d_%Hh%M.%S.%f':
+                       time.strftime(format.replace('.%f', '')))
+logging = SimpleNamespace(EXP=22, WARNING=30, LogFile=lambda *args, **kwargs: None,
+                          console=SimpleNamespace(setLevel=lambda level: None),
+                          warning=lambda message: print('WARNING', message, file=sys.stderr),
+                          exp=lambda message: None)
+
+configure()
+
+
+def run_session(script='decisions.tokens', trajectory=None, refresh_rate=60):
+    """Runs a whole experiment script with the headless backend.
+    :param str script: module name (default the experiment) or path of the script
+    :param trajectory: function (trial, t) -> (x, y) (optional)
+    :param float refresh_rate: virtual refresh rate (Hz)
+    :returns: `stats()` of the session
+    """
+
+    import os
+    import runpy
+    from decisions import headless  #the module the script gets from load_backend (not __main__)
+    headless.configure(trajectory, refresh_rate)
+    os.environ['DECISIONS_BACKEND'] = 'headless'
+    try:
+        if script.endswith('.py'):
+            runpy.run_path(script, run_name='__main__')
+        else:
+            runpy.run_module(script, run_name='__main__', alter_sys=True)
+    except SystemExit:  #core.quit()
+        pass
+    return headless.stats()
+
+
+def main(argv=None):
+    import argparse
+    import cProfile
+    import pstats
+    parser = argparse.ArgumentParser(description='Run the experiment without a display.')
+    parser.add_argument('script', nargs='?', default='decisions.tokens', help='module or path of the script')
+    parser.add_argument('--refresh-rate', type=float, default=60)
+    parser.add_argument('--profile', action='store_true', help='print the 25 slowest functions')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.profile:
+        profiler = cProfile.Profile()
+        session = profiler.runcall(run_session, args.script, None, args.refresh_rate)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+    else:
+        session = run_session(args.script, None, args.refresh_rate)
+    print('%.1f s of virtual time (%s flips, %s draws) in %.1f s'
+          % (session['virtual_time'], session['flips'], session['draws'], time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import numpy as np
+
+"""
+Kinematics recorder for the frame loop.
+
+Mouse positions, timestamps and velocities of a trial are stored in arrays
+allocated once for the session (sized for the longest possible trial,
+num_tokens * frames_per_token frames) and reused every trial, so recording a
+frame does not allocate anything. Velocity windows and the cursor shadow are
+read by index, in constant time.
+"""
+
+
+def new_recorder(max_frames):
+    """Creates a recorder for trials of up to `max_frames` frames (it grows
+    if more frames are recorded).
+    :param int max_frames: number of frames to allocate
+    :returns: dict with the arrays and the number of recorded frames 'n'
+    """
+
+    return {'path'    : np.zeros((max_frames, 2)),
+            'times'   : np.zeros(max_frames),
+            'velocity': np.full(max_frames, np.nan),  #NaN where not measured ('NA')
+            'n'       : 0}
+
+
+def reset_recorder(recorder):
+    """Starts a new trial (previous data is overwritten)."""
+    recorder['n'] = 0
+
+
+def record(recorder, x, y, time):
+    """Stores the mouse position and time of a frame.
+    :param float x: mouse x position
+    :param float y: mouse y position
+    :param float time: time of the position
+    """
+
+    n = recorder['n']
+    if n == len(recorder['times']):  #full, double the size
+        for name in 'path', 'times', 'velocity':
+            extra = np.full_like(recorder[name], np.nan if name == 'velocity' else 0)
+            recorder[name] = np.concatenate((recorder[name], extra))
+    recorder['path'][n] = x, y
+    recorder['times'][n] = time
+    recorder['velocity'][n] = np.nan
+    recorder['n'] = n + 1
+
+
+def window_velocity(recorder, window):
+    """Distance travelled between the last recorded position and the one
+    `window`-1 frames before (same as path[-1] vs path[-window] of a list).
+    Returns None until more than `window` frames have been recorded.
+    :param int window: time window in frames
+    """
+
+    n = recorder['n']
+    if n <= window:
+        return None
+    dx = recorder['path'][n-1, 0] - recorder['path'][n-window, 0]
+    dy = recorder['path'][n-1, 1] - recorder['path'][n-window, 1]
+    return (dx*dx + dy*dy) ** .5
+
+
+def set_velocity(recorder, velocity):
+    """Stores the velocity of the last recorded frame."""
+    recorder['velocity'][recorder['n']-1] = velocity
+
+
+def last_positions(recorder, length):
+    """The last `length` positions, oldest first (a view, not a copy).
+    :param int length: number of positions
+    """
+
+    n = recorder['n']
+    return recorder['path'][max(0, n-length):n]
+
+
+def recorded(recorder):
+    """Copies of the path, times and velocity recorded in the current trial
+    (safe to hand to the writer while the recorder is reused)."""
+
+    n = recorder['n']
+    return (recorder['path'][:n].copy(), recorder['times'][:n].copy(),
+            recorder['velocity'][:n].copy())
@@ -0,0 +1,244 @@
+import argparse
+import json
+import numpy as np
+from .tokentools import sequences_to_array, get_prob_matrix
+
+"""
+Simulation and fitting of decision models on the token sequences.
+
+Two models of the choice and response time are compared:
+- 'integrator': a decision variable sums the token movements (+drift for a
+  token going right, -drift going left) plus Gaussian noise, and a choice is
+  made when it reaches +bound or -bound.
+- 'urgency': the evidence (2*p(r) - 1, p(r) from `get_prob_matrix`) is
+  low-pass filtered with time constant tau, plus noise, and multiplied by an
+  urgency signal growing linearly with time (slope * t). A choice is made
+  when the product reaches +1 or -1.
+Both add a non-decision time (ndt) to the decision time.
+
+Time advances in `substeps` steps per token (a token is shown for
+normal_speed/hz seconds). All parameter sets, trials and simulations of a
+step are updated at once in arrays of shape (parameter sets, trials,
+simulations). The same noise is used for every parameter set (common random
+numbers), which also makes the fitting objective smooth.
+
+A model is fitted to each participant by maximising a simulated likelihood
+(Gaussian kernel density of the simulated RTs with the observed choice) with
+a shrinking random search, and the models are compared with the BIC:
+
+    decisions fit data/*.csv --out fits.json
+"""
+
+# Parameters of each model and their search bounds
+MODELS = {'integrator': {'params': ('drift', 'noise', 'bound', 'ndt'),
+                         'bounds': ((0., 5.), (.01, 3.), (.1, 10.), (0., 1.))},
+          'urgency'   : {'params': ('tau', 'noise', 'slope', 'ndt'),
+                         'bounds': ((.01, 2.), (.01, 3.), (.1, 10.), (0., 1.))}}
+
+# Most values of a (parameter sets, trials, simulations) array at once
+MAX_ELEMENTS = 4 * 10**6
+
+
+def make_evidence(sequences, num_tokens, token_duration):
+    """Evidence of the trials, as used by the models.
+    :param sequences: text sequences, or a 2-D array (1 = right, 0 = left)
+    :param int num_tokens: the number of tokens
+    :param float token_duration: time each token is shown (s)
+    :returns: dict with 'moves' (trials, num_tokens) of +1/-1 (right/left),
+        'probs' (trials, num_tokens+1) of p(r) and 'token_duration'
+    """
+
+    moves = sequences if isinstance(sequences, np.ndarray) else sequences_to_array(sequences)
+    moves = np.atleast_2d(moves)
+    return {'moves': np.where(moves != 0, 1., -1.),
+            'probs': get_prob_matrix(moves, num_tokens),
+            'token_duration': token_duration}
+
+
+def simulate(model, evidence, params, n_sims=100, substeps=4, seed=0):
+    """Simulates choices and response times for many parameter sets at once.
+    :param str model: 'integrator' or 'urgency'
+    :param dict evidence: from `make_evidence`
+    :param params: array of shape (parameter sets, parameters), in the order
+        of MODELS[model]['params']
+    :param int n_sims: simulations per trial
+    :param int substeps: time steps per token
+    :param int seed: seed of the noise (the same for all parameter sets)
+    :returns: choices (+1 right, -1 left, 0 no decision) and response times
+        (NaN without decision), both of shape (parameter sets, trials, n_sims)
+    """
+
+    params = np.atleast_2d(np.asarray(params, dtype=float))[:, :, None, None]
+    moves, probs = evidence['moves'], evidence['probs']
+    n_trials, num_tokens = moves.shape
+    dt = evidence['token_duration'] / substeps
+    rng = np.random.default_rng(seed)
+
+    shape = (len(params), n_trials, n_sims)
+    x = np.zeros(shape)
+    choices = np.zeros(shape, dtype=np.int8)
+    rts = np.full(shape, np.nan)
+    if model == 'integrator':
+        drift, noise, bound, ndt = params.transpose(1, 0, 2, 3)
+    elif model == 'urgency':
+        tau, noise, slope, ndt = params.transpose(1, 0, 2, 3)
+        rate = np.minimum(dt / tau, 1)
+        filtered = np.zeros(shape)
+    else:
+        raise ValueError('Unknown model %r, use one of %s.' % (model, tuple(MODELS)))
+
+    for step in range(num_tokens * substeps):
+        token, t = step // substeps, (step + 1) * dt
+        shared_noise = rng.standard_normal((n_trials, n_sims)) * np.sqrt(dt)
+        if model == 'integrator':
+            x += noise * shared_noise
+            if step % substeps == 0:  #the token moves
+                x += drift * moves[:, token, None]
+            crossed = np.abs(x) >= bound
+        else:
+            signal = 2 * probs[:, token + 1, None] - 1
+            filtered += rate * (signal - filtered) + noise * shared_noise
+            x = filtered * slope * t
+            crossed = np.abs(x) >= 1
+        new = crossed & (choices == 0)
+        choices[new] = np.sign(x[new])
+        rts[new] = t
+    return choices, rts + ndt
+
+
+def log_likelihood(choices, rts, observed_choices, observed_rts, bandwidth=.05):
+    """Simulated log-likelihood of the observed trials for each parameter set.
+    Each trial's likelihood is the Gaussian kernel density, at the observed
+    RT, of the simulations that made the observed choice (times their
+    proportion). Trials without response count the simulations without decision.
+    :param choices: simulated choices (parameter sets, trials, simulations)
+    :param rts: simulated response times, same shape
+    :param observed_choices: +1/-1 (0 without response) of each trial
+    :param observed_rts: response time of each trial (s)
+    :param float bandwidth: kernel bandwidth (s)
+    :returns: array with the log-likelihood of each parameter set
+    """
+
+    observed_choices = np.asarray(observed_choices)[None, :, None]
+    observed_rts = np.nan_to_num(np.asarray(observed_rts, dtype=float))[None, :, None]
+    same = choices == observed_choices
+    kernel = np.exp(-.5 * ((np.nan_to_num(rts) - observed_rts) / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    density = np.where(observed_choices == 0, same, same * kernel).mean(axis=2)
+    return np.log(np.maximum(density, 1e-10)).sum(axis=1)
+
+
+def evaluate(model, evidence, observed_choices, observed_rts, params, n_sims=100,
+             substeps=4, seed=0, bandwidth=.05):
+    """Log-likelihood of many parameter sets, simulated in chunks of at most
+    MAX_ELEMENTS values.
+    :param params: array of shape (parameter sets, parameters)
+    :returns: array with the log-likelihood of each parameter set
+    """
+
+    params = np.atleast_2d(params)
+    chunk = max(1, MAX_ELEMENTS // (len(evidence['moves']) * n_sims))
+    result = []
+    for start in range(0, len(params), chunk):
+        choices, rts = simulate(model, evidence, params[start:start+chunk], n_sims, substeps, seed)
+        result += [log_likelihood(choices, rts, observed_choices, observed_rts, bandwidth)]
+    return np.concatenate(result)
+
+
+def fit(model, evidence, observed_choices, observed_rts, n_candidates=256, rounds=5,
+        shrink=.5, n_sims=100, substeps=4, seed=0, bandwidth=.05):
+    """Fits a model with a shrinking random search: uniform candidates within
+    the bounds, then in each round candidates around the best one so far,
+    with a search width multiplied by `shrink`.
+    :param str model: 'integrator' or 'urgency'
+    :param dict evidence: from `make_evidence`
+    :param observed_choices: +1/-1 (0 without response) of each trial
+    :param observed_rts: response time of each trial (s)
+    :returns: dict with the 'params', 'loglik', 'bic' and 'aic'
+    """
+
+    rng = np.random.default_rng(seed)
+    low, high = np.array(MODELS[model]['bounds']).T
+    width = high - low
+    candidates = low + rng.random((n_candidates, len(low))) * width
+    best, best_loglik = None, -np.inf
+    for i in range(rounds):
+        loglik = evaluate(model, evidence, observed_choices, observed_rts, candidates,
+                          n_sims, substeps, seed, bandwidth)
+        if loglik.max() > best_loglik:
+            best, best_loglik = candidates[loglik.argmax()], loglik.max()
+        width = width * shrink
+        candidates = np.clip(best + rng.normal(0, 1, (n_candidates, len(low))) * width / 2, low, high)
+        candidates[0] = best
+
+    n_params, n_trials = len(low), len(observed_rts)
+    return {'model' : model,
+            'params': dict(zip(MODELS[model]['params'], best.tolist())),
+            'loglik': float(best_loglik),
+            'bic'   : float(n_params * np.log(n_trials) - 2 * best_loglik),
+            'aic'   : float(2 * n_params - 2 * best_loglik)}
+
+
+def fit_file(filename, models=tuple(MODELS), **settings):
+    """Fits the models to one participant's data file.
+    :param str filename: CSV file written by tokens.py
+    :param tuple models: names of the models
+    :param settings: keyword arguments of `fit`
+    :returns: dict with the file name, number of trials and the fit of each model
+    """
+
+    from .analysis import read_data
+    data = read_data(filename)
+    evidence = make_evidence(list(data['sequence']), int(data['num_tokens'][0]),
+                             data['normal_speed'][0] / data['hz'][0])
+    choices = np.where(data['resp'] == 'r', 1, np.where(data['resp'] == 'l', -1, 0))
+    return {'file'  : filename,
+            'trials': len(choices),
+            'fits'  : {model: fit(model, evidence, choices, data['rt'], **settings) for model in models}}
+
+
+def fit_archive(filenames, models=tuple(MODELS), processes=None, **settings):
+    """Fits the models to many participants, in parallel.
+    :param list filenames: CSV files written by tokens.py
+    :param int processes: number of worker processes (optional, default
+        one per CPU; 1 to fit in this process)
+    :returns: list of `fit_file` results
+    """
+
+    if processes == 1 or len(filenames) < 2:
+        return [fit_file(filename, models, **settings) for filename in filenames]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(fit_file, filename, models, **settings) for filename in filenames]
+        return [future.result() for future in futures]
+
+
+def compare_models(results):
+    """Summed BIC of each model over participants, and the number of
+    participants best fitted by each model."""
+
+    models = list(results[0]['fits']) if results else []
+    best = [min(models, key=lambda m: r['fits'][m]['bic']) for r in results]
+    return {model: {'bic' : sum(r['fits'][model]['bic'] for r in results),
+                    'best': best.count(model)} for model in models}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit the decision models to the data files.')
+    parser.add_argument('files', nargs='*', default=['data/*.csv'], help='data files (glob patterns)')
+    parser.add_argument('--out', help='JSON file for the fits')
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--sims', type=int, default=100, help='simulations per trial')
+    parser.add_argument('--processes', type=int, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    from .analysis import data_files
+    filenames = data_files(args.files)
+    results = fit_archive(filenames, tuple(args.models), args.processes, n_sims=args.sims)
+    print(json.dumps(compare_models(results), indent=1))
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            json.dump(results, out_file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
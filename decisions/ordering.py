@@ -0,0 +1,211 @@
+import numpy as np
+from collections import Counter
+from .tokentools import make_trial
+
+"""
+Trial orders that meet run-length, counterbalancing and transition
+constraints by construction.
+
+A trial's condition is its (trial type, winning side). `make_conditions`
+counterbalances the sides within each trial type, and `order_conditions`
+builds the order one trial at a time, choosing among the conditions whose
+trial type and side would not make a run longer than allowed and would
+still leave a feasible order for the remaining trials. Choices are random,
+weighted by the remaining count of each condition and, optionally, by how
+far the transition from the previous trial type is below its expected
+frequency. Each step looks at the (few) distinct conditions only, so a
+session is usually ordered in time linear in its length, without rejection.
+The type and side counts are checked separately, which can still lead to a
+dead end (e.g. with runs of 1, types and sides that must alternate
+together). The last trials are then undone and other conditions tried, a
+depth-first search that remembers the dead-end states (remaining counts
+and runs), so an order is found whenever one exists.
+"""
+
+
+def make_conditions(templates, nr_per_type, nr_random=0, rng=None):
+    """The (trial type, winning side) of each trial of a session, half of
+    each trial type Left-winning and half Right-winning (the odd trials of a
+    type, and the `nr_random` trials of random types, are balanced across
+    sides over the whole session).
+    :params dict templates: a dictionary with trial_type as key and the template as value
+    :params int nr_per_type: number of repetitions of each template
+    :params int nr_random: number of trials of randomly chosen types
+    :params rng: a numpy Generator (optional)
+    :returns: list of (trial_type, side) tuples, in no particular order
+    """
+
+    if rng is None: rng = np.random.default_rng()
+
+    trial_types = list(templates)
+    counts = {trial_type: nr_per_type for trial_type in trial_types}
+    for i in rng.integers(0, len(trial_types), size=nr_random):
+        counts[trial_types[i]] += 1
+
+    conditions, odd = [], []
+    for trial_type in trial_types:
+        conditions += [(trial_type, 'l'), (trial_type, 'r')] * (counts[trial_type] // 2)
+        if counts[trial_type] % 2:
+            odd += [trial_type]
+    # Sides of the odd trials alternate, starting from a random side
+    first = rng.integers(2)
+    for i, trial_type in enumerate(rng.permutation(odd).tolist()):
+        conditions += [(trial_type, 'lr'[(first + i) % 2])]
+    return conditions
+
+
+def _feasible(remaining, total, last, run, max_run):
+    """Whether the remaining values of one attribute (e.g. sides) can be
+    ordered without runs longer than `max_run`, after a run of `run` times
+    the value `last`: each value needs a different value between its blocks.
+    :param dict remaining: remaining count of each value
+    :param int total: sum of the remaining counts
+    """
+
+    if max_run is None:
+        return True
+    for value, count in remaining.items():
+        blocks_room = max_run * (total - count + 1) - (run if value == last else 0)
+        if count > blocks_room:
+            return False
+    return True
+
+
+def order_conditions(conditions, max_type_run=3, max_side_run=3, balance_transitions=True, rng=None):
+    """Orders the trials of a session so that no trial type and no winning
+    side repeats more than `max_type_run` / `max_side_run` times in a row.
+    :params list conditions: (trial_type, side) of each trial (e.g. from `make_conditions`)
+    :params int max_type_run: longest run of the same trial type (None: no limit)
+    :params int max_side_run: longest run of the same winning side (None: no limit)
+    :params bool balance_transitions: favour the trial type transitions
+        (previous type -> type) that are below their expected frequency
+    :params rng: a numpy Generator (optional)
+    :returns: list of (trial_type, side) tuples
+    :raises ValueError: if no order of the conditions meets the limits
+    """
+
+    if rng is None: rng = np.random.default_rng()
+
+    counts = Counter(conditions)
+    classes = sorted(counts)
+    remaining = [counts[c] for c in classes]
+    types = sorted(set(c[0] for c in classes))
+    sides = sorted(set(c[1] for c in classes))
+    type_left = {t: sum(r for c, r in zip(classes, remaining) if c[0] == t) for t in types}
+    side_left = {s: sum(r for c, r in zip(classes, remaining) if c[1] == s) for s in sides}
+    total = len(conditions)
+    if not _feasible(type_left, total, None, 0, max_type_run):
+        raise ValueError('Too many trials of one type (%s) for runs of at most %s.' % (type_left, max_type_run))
+    if not _feasible(side_left, total, None, 0, max_side_run):
+        raise ValueError('Too many trials of one side (%s) for runs of at most %s.' % (side_left, max_side_run))
+
+    # Expected number of each type -> type transition in a random order
+    expected = {(a, b): type_left[a] * (type_left[b] - (a == b)) / max(total - 1, 1) for a in types for b in types}
+    transitions = {pair: 0 for pair in expected}
+
+    def state(remaining, last_type, type_run, last_side, side_run):
+        """What decides whether the rest can be ordered (runs only matter with a limit)."""
+        return (tuple(remaining), last_type, type_run if max_type_run is not None else 0,
+                last_side, side_run if max_side_run is not None else 0)
+
+    order = []
+    # One entry per trial of the order: its class, the runs before it and
+    # the classes already tried at its position
+    path = []
+    # States from which no order of the remaining trials exists
+    dead = set()
+    tried = set()
+    last_type, type_run, last_side, side_run = None, 0, None, 0
+    while total:
+        allowed = []
+        for k, (trial_type, side) in enumerate(classes):
+            if not remaining[k] or k in tried:
+                continue
+            new_type_run = type_run + 1 if trial_type == last_type else 1
+            new_side_run = side_run + 1 if side == last_side else 1
+            if max_type_run is not None and new_type_run > max_type_run:
+                continue
+            if max_side_run is not None and new_side_run > max_side_run:
+                continue
+            type_left[trial_type] -= 1
+            side_left[side] -= 1
+            remaining[k] -= 1
+            if (_feasible(type_left, total - 1, trial_type, new_type_run, max_type_run)
+                    and _feasible(side_left, total - 1, side, new_side_run, max_side_run)
+                    and state(remaining, trial_type, new_type_run, side, new_side_run) not in dead):
+                allowed += [k]
+            type_left[trial_type] += 1
+            side_left[side] += 1
+            remaining[k] += 1
+
+        if not allowed:  # dead end: undo the last trial and try another class there
+            dead.add(state(remaining, last_type, type_run, last_side, side_run))
+            if not path:
+                raise ValueError('No order of these trials meets the run-length limits.')
+            k, last_type, type_run, last_side, side_run, tried = path.pop()
+            trial_type, side = order.pop()
+            if last_type is not None:
+                transitions[last_type, trial_type] -= 1
+            remaining[k] += 1
+            type_left[trial_type] += 1
+            side_left[side] += 1
+            total += 1
+            continue
+
+        weights = np.array([remaining[k] for k in allowed], dtype=float)
+        if balance_transitions and last_type is not None:
+            deficits = np.array([expected[last_type, classes[k][0]] - transitions[last_type, classes[k][0]]
+                                 for k in allowed])
+            weights *= np.maximum(deficits, 0) + .1
+        k = allowed[rng.choice(len(allowed), p=weights / weights.sum())]
+
+        trial_type, side = classes[k]
+        path += [(k, last_type, type_run, last_side, side_run, tried | {k})]
+        tried = set()
+        if last_type is not None:
+            transitions[last_type, trial_type] += 1
+        type_run = type_run + 1 if trial_type == last_type else 1
+        side_run = side_run + 1 if side == last_side else 1
+        last_type, last_side = trial_type, side
+        order += [classes[k]]
+        remaining[k] -= 1
+        type_left[trial_type] -= 1
+        side_left[side] -= 1
+        total -= 1
+    return order
+
+
+def order_summary(order):
+    """Longest runs of the same trial type and side, and the count of each
+    trial type transition, of an order of (trial_type, side) tuples."""
+
+    summary = {'longest_type_run': 0, 'longest_side_run': 0, 'transitions': {}}
+    for key, name in (0, 'longest_type_run'), (1, 'longest_side_run'):
+        run = 0
+        for i, condition in enumerate(order):
+            run = run + 1 if i and condition[key] == order[i-1][key] else 1
+            summary[name] = max(summary[name], run)
+    for previous, condition in zip(order, order[1:]):
+        pair = previous[0] + '->' + condition[0]
+        summary['transitions'][pair] = summary['transitions'].get(pair, 0) + 1
+    return summary
+
+
+def ordered_experiment_sequences(templates, num_tokens, nr_per_type, nr_random=0, max_type_run=3,
+    max_side_run=3, format_to='letters', rng=None):
+    """Trials of a session (as `iter_experiment_sequences`) in an order that
+    meets the run-length limits, created one at a time when needed.
+    :params dict templates: a dictionary with trial_type as key and the template as value
+    :params int num_tokens: the number of tokens (the length of the sequence)
+    :params int nr_per_type: number of repetitions of each template
+    :params int nr_random: number of trials of randomly chosen types
+    :params int max_type_run: longest run of the same trial type
+    :params int max_side_run: longest run of the same winning side
+    :params str format_to: 'letters' (default) or 'digits'
+    :params rng: a numpy Generator (optional)
+    """
+
+    if rng is None: rng = np.random.default_rng()
+    conditions = make_conditions(templates, nr_per_type, nr_random, rng)
+    for trial_type, side in order_conditions(conditions, max_type_run, max_side_run, rng=rng):
+        yield make_trial(templates, trial_type, num_tokens, side, format_to)
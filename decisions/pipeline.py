@@ -0,0 +1,91 @@
+import queue
+import threading
+import numpy as np
+from .tokentools import get_prob_matrix
+from .seeding import trial_rngs
+from .visualtools import (create_coordinates_batch, poisson_disc_coordinates,
+                         token_masks, token_settings)
+
+"""
+Trial preparation pipeline.
+
+Everything a trial needs except the PsychoPy objects (sequence, p(r)
+trajectory, token coordinates, index lists and visibility masks) is prepared
+by `prepare_trial`. `prefetch` runs the preparation in a background thread,
+a bounded number of trials ahead, so the experiment can start at once and
+only keeps a few trials in memory.
+"""
+
+
+def prepare_trial(trial, num_tokens, layout, rng=None):
+    """Adds to a trial (from `experiment_sequences`) everything needed to show it.
+    :param dict trial: trial with 'trial_type', 'token_sequence' and 'winning_side'
+    :param int num_tokens: the number of tokens
+    :param dict layout: 'layout' ('grid' or 'poisson'), 'loc', 'side_tokens',
+        'circle_radius', 'token_size' and 'c_offset'
+    :param rng: a numpy Generator (optional, not used for a trial with a
+        'seed', which has its own layout stream, see seeding.py)
+    :returns: a new dict, with also 'probs', 'xys', 'stgs' and 'masks'
+    """
+
+    if 'seed' in trial:
+        rng = trial_rngs(trial['seed'])['layout']
+    elif rng is None: 
+        rng = np.random.default_rng()
+    token_sequence = trial['token_sequence']
+    trial = dict(trial)
+    trial['probs'] = get_prob_matrix([token_sequence], num_tokens)[0]
+    if layout['layout'] == 'poisson':
+        trial['xys'] = poisson_disc_coordinates(num_tokens, layout['circle_radius'],
+                                                layout['token_size'], rng=rng)
+    else:
+        trial['xys'] = create_coordinates_batch(layout['loc'], layout['side_tokens'],
+                                                layout['circle_radius'], layout['token_size'],
+                                                1, num_tokens, rng)[0]
+    trial['stgs'] = token_settings(token_sequence, layout['loc'], layout['c_offset'], rng)
+    trial['masks'] = token_masks(token_sequence)
+    return trial
+
+
+def prepared_trials(trials, num_tokens, layout, rng=None):
+    """Generator of prepared trials (see `prepare_trial`).
+    :param trials: iterable of trials, e.g. from `iter_experiment_sequences`
+    """
+
+    if rng is None: rng = np.random.default_rng()
+    for trial in trials:
+        yield prepare_trial(trial, num_tokens, layout, rng)
+
+
+# Marks the end of the items in a prefetch queue
+_DONE = object()
+
+
+def prefetch(iterable, size=2):
+    """Runs an iterable in a background thread, at most `size` items ahead of
+    the consumer. Exceptions of the worker are raised in the consumer.
+    The worker only runs while the queue is not full, that is right after an
+    item is taken (at the start of a trial), and then waits.
+    :param iterable: e.g. `prepared_trials(...)`
+    :param int size: number of items prepared in advance
+    """
+
+    items = queue.Queue(maxsize=size)
+
+    def worker():
+        try:
+            for item in iterable:
+                items.put(item)
+        except BaseException as error:
+            items.put((_DONE, error))
+            return
+        items.put((_DONE, None))
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        item = items.get()
+        if isinstance(item, tuple) and len(item) == 2 and item[0] is _DONE:
+            if item[1] is not None:
+                raise item[1]
+            return
+        yield item
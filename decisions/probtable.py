@@ -0,0 +1,251 @@
+import json
+import os
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from math import ceil, floor, lgamma, log, sqrt
+import numpy as np
+
+"""
+Precomputed p(r) tables, and a log-space engine for long sequences.
+
+For a given NC, p(r) only depends on the upper bound of the summation in
+`get_prob`, high_bound = min(NC, floor(num_tokens/2) - NL). Each row of the
+table therefore holds the (rounded) prefix sums of one row of Pascal's
+triangle, and any p(r) becomes a lookup: table[NC][high_bound].
+
+The tables grow with num_tokens**2, so above TABLE_MAX_TOKENS p(r) is
+computed by the log-space engine instead: p(r) is the binomial CDF
+P(X <= high_bound) with X ~ Binomial(NC, 1/2), summed from terms
+exp(lgamma(NC+1) - lgamma(k+1) - lgamma(NC-k+1) - NC*log(2)), which never
+overflow. Only the terms within 20 standard deviations of NC/2 are summed,
+the others being below 1e-80. It is vectorized over arrays of (NC, high_bound).
+"""
+
+# Largest num_tokens using the tables (above: the log-space engine)
+TABLE_MAX_TOKENS = 1000
+# Half width of the summed terms, in standard deviations of Binomial(NC, 1/2)
+WINDOW_SDS = 20
+
+# In-memory caches: num_tokens -> table (lists), num_tokens -> 2-D array
+_prob_tables = {}
+_prob_arrays = {}
+# log(k!) for k = 0, 1, ... (grown as needed)
+_log_factorials = np.zeros(1)
+
+
+def _prob_row(NC, factorials):
+    """Rounded p(r) for every summation bound (0 to NC) of a given NC.
+    The terms are added in the same order and with the same float
+    arithmetic as the original `get_prob` formula, so the rounded values
+    are identical. When the float formula overflows (large NC) the exact
+    binomial prefix sums are used instead.
+    :param int NC: tokens remaining at the center
+    :param list factorials: factorials from 0! up to at least NC!
+    """
+
+    row = []
+    try:
+        first_part = factorials[NC]/(2**NC)
+        summation = 0
+        for k in range(0, NC+1):
+            summation += 1/(factorials[k]*factorials[NC - k])
+            row += [round(first_part * summation, 2)]
+    except OverflowError:
+        # Exact Pascal-triangle prefix sums, divided once by 2**NC
+        row = []
+        binomial = 1  # C(NC, 0)
+        cumulative = 0
+        for k in range(0, NC+1):
+            cumulative += binomial
+            row += [round(cumulative / 2**NC, 2)]
+            binomial = binomial * (NC - k) // (k + 1)  # next row item
+    return row
+
+
+def build_prob_table(num_tokens):
+    """Build the table of rounded p(r) values for a sequence length.
+    Row NC (0 to num_tokens) holds the p(r) for each summation bound.
+    :param int num_tokens: length of the sequence
+    """
+
+    factorials = [1]
+    for k in range(1, num_tokens+1):
+        factorials += [factorials[-1] * k]
+    return [_prob_row(NC, factorials) for NC in range(num_tokens+1)]
+
+
+def prob_table_path(num_tokens, cache_dir):
+    """Returns the file name of a table stored on disk.
+    :param int num_tokens: length of the sequence
+    :param str cache_dir: folder where the tables are stored
+    """
+
+    return cache_dir + os.path.sep + 'prob_table_%s.json' % num_tokens
+
+
+def get_prob_table(num_tokens, cache_dir=None):
+    """Returns the table for `num_tokens`, building it only once.
+    Tables are kept in memory and, if a `cache_dir` is given, also read from
+    and written to disk so they survive between sessions.
+    :param int num_tokens: length of the sequence
+    :param str cache_dir: folder for the on-disk cache (optional)
+    """
+
+    if num_tokens in _prob_tables:
+        return _prob_tables[num_tokens]
+
+    table = None
+    if cache_dir is not None:
+        path = prob_table_path(num_tokens, cache_dir)
+        if os.path.isfile(path):
+            with open(path, 'r') as table_file:
+                table = json.load(table_file)
+    if table is None:
+        table = build_prob_table(num_tokens)
+        if cache_dir is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with open(prob_table_path(num_tokens, cache_dir), 'w') as table_file:
+                json.dump(table, table_file)
+
+    _prob_tables[num_tokens] = table
+    return table
+
+
+def get_prob_array(num_tokens, cache_dir=None):
+    """Returns the table for `num_tokens` as a square NumPy array, with
+    array[NC, high_bound] = p(r). Cells where high_bound > NC are padded
+    with the row's last value (p = 1).
+    :param int num_tokens: length of the sequence
+    :param str cache_dir: folder for the on-disk cache (optional)
+    """
+
+    if num_tokens in _prob_arrays:
+        return _prob_arrays[num_tokens]
+
+    table = get_prob_table(num_tokens, cache_dir)
+    array = np.ones((num_tokens+1, num_tokens+1))
+    for NC, row in enumerate(table):
+        array[NC, :NC+1] = row
+        array[NC, NC+1:] = row[-1]
+    _prob_arrays[num_tokens] = array
+    return array
+
+
+def log_factorials(n):
+    """log(k!) for k = 0 to at least n, from `math.lgamma`."""
+    global _log_factorials
+    if len(_log_factorials) <= n:
+        _log_factorials = np.array([lgamma(k + 1) for k in range(max(n + 1, 2 * len(_log_factorials)))])
+    return _log_factorials
+
+
+@lru_cache(maxsize=1024)
+def cdf_window(NC):
+    """Binomial(NC, 1/2) CDF over the values of k that hold all of the mass.
+    :param int NC: tokens remaining at the center
+    :returns: the first k of the window and the CDF at each k of the window
+        (the CDF is 0 below the window and 1 above it)
+    """
+
+    half_width = WINDOW_SDS * sqrt(NC) / 2 + 1
+    low, high = max(0, floor(NC / 2 - half_width)), min(NC, ceil(NC / 2 + half_width))
+    k = np.arange(low, high + 1)
+    log_f = log_factorials(NC)
+    terms = np.exp(log_f[NC] - log_f[k] - log_f[NC - k] - NC * log(2))
+    cdf = np.cumsum(terms)
+    cdf.flags.writeable = False  #shared by the cache
+    return low, cdf
+
+
+def binomial_cdf(NC, high_bound):
+    """P(X <= high_bound) with X ~ Binomial(NC, 1/2), computed in log space
+    (unrounded p(r)). Arguments are integers or arrays that broadcast together.
+    :param NC: tokens remaining at the center
+    :param high_bound: upper bound of the summation (0 below 0, 1 from NC)
+    """
+
+    NC, high_bound = np.broadcast_arrays(np.asarray(NC, dtype=np.int64),
+                                         np.asarray(high_bound, dtype=np.int64))
+    result = np.where(high_bound >= NC, 1., 0.)
+    inside = np.flatnonzero((high_bound >= 0) & (high_bound < NC))
+    if len(inside):
+        NC_flat, bound_flat, result_flat = NC.ravel(), high_bound.ravel(), result.ravel()
+        # One window per distinct NC
+        inside = inside[np.argsort(NC_flat[inside], kind='stable')]
+        values, starts = np.unique(NC_flat[inside], return_index=True)
+        for value, group in zip(values.tolist(), np.split(inside, starts[1:])):
+            low, cdf = cdf_window(value)
+            position = bound_flat[group] - low
+            result_flat[group] = np.where(position < 0, 0., cdf[np.clip(position, 0, len(cdf) - 1)])
+        result = result_flat.reshape(result.shape)
+    return result if result.ndim else float(result)
+
+
+def prob_right(NC, NL, num_tokens):
+    """p(r) rounded to 2 decimals, from the log-space engine. Arguments are
+    integers or arrays that broadcast together.
+    :param NC: tokens remaining at the center
+    :param NL: tokens moved to the left
+    :param int num_tokens: length of the sequence
+    """
+
+    high_bound = np.minimum(NC, num_tokens // 2 - np.asarray(NL))
+    # Rounded to 10 decimals first so that exact ties (e.g. 0.125) are not
+    # decided by the last bits of the sum
+    return np.round(np.round(binomial_cdf(NC, high_bound), 10), 2)
+
+
+def get_prob_row(num_tokens, NC):
+    """p(r) for every summation bound (0 to NC) of a given NC: the row of
+    the table, or the same values from the log-space engine above
+    TABLE_MAX_TOKENS.
+    :param int num_tokens: length of the sequence
+    :param int NC: tokens remaining at the center
+    """
+
+    if num_tokens <= TABLE_MAX_TOKENS:
+        return get_prob_table(num_tokens)[NC]
+    low, cdf = cdf_window(NC)
+    row = np.ones(NC + 1)
+    row[:low] = 0.
+    row[low:low + len(cdf)] = cdf
+    return np.round(np.round(row, 10), 2).tolist()
+
+
+def get_NL_range(num_tokens, NC, prob_min, prob_max):
+    """Inverse lookup: the range of NL (0 to num_tokens-1) for which p(r) is
+    within [prob_min, prob_max], for a given NC.
+    p(r) only depends on NL through the summation bound
+    high_bound = min(NC, floor(num_tokens/2) - NL), and a row of the table is
+    non-decreasing in high_bound, so the accepted bounds are found with two
+    binary searches and then mapped back to NL.
+    Returns None if no NL gives a p(r) within the band.
+    :param int num_tokens: length of the sequence
+    :param int NC: tokens remaining at the center
+    :param float prob_min: minimum p(r)
+    :param float prob_max: maximum p(r)
+    """
+
+    half = num_tokens // 2
+    # p(r) for high_bound = -1 (empty summation, p = 0) up to high_bound = NC
+    row = [0.0] + get_prob_row(num_tokens, NC)
+    # Lowest and highest accepted high_bound (offset by 1 because of the 0)
+    bound_lo = bisect_left(row, prob_min) - 1
+    bound_hi = bisect_right(row, prob_max) - 2
+    if bound_lo > bound_hi:
+        return None
+
+    # high_bound (clipped at -1) decreases as NL increases
+    NL_min = 0 if bound_hi >= NC else max(0, half - bound_hi)
+    NL_max = num_tokens - 1 if bound_lo <= -1 else min(num_tokens - 1, half - bound_lo)
+    if NL_min > NL_max:
+        return None
+    return NL_min, NL_max
+
+
+def clear_prob_tables():
+    """Empties the in-memory cache of tables (and of log-space windows)."""
+    _prob_tables.clear()
+    _prob_arrays.clear()
+    cdf_window.cache_clear()
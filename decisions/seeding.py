@@ -0,0 +1,109 @@
+import numpy as np
+from .tokentools import make_trial
+from .ordering import make_conditions, order_conditions
+
+"""
+Seeds of sessions and trials.
+
+A session is identified by the entropy of a `numpy.random.SeedSequence`
+(a large integer). From it come independent streams:
+- the session stream (spawn key (1,)): trial types, sides and their order
+- one stream per trial (spawn key (0, trial)), reduced to a 64-bit trial
+  seed. A trial seed gives its own streams, one per name in STREAMS: the
+  token sequence and the layout (jitter and shortlist of the positions).
+A trial can therefore be recomputed from its seed (and its trial type and
+side) alone, in any order or in parallel, with bit-identical results:
+`seeded_trial` gives the sequence, and `pipeline.prepare_trial` the layout.
+"""
+
+# Streams of a trial, in spawn order (append only, to keep old seeds valid)
+STREAMS = ('sequence', 'layout')
+
+
+def session_entropy(entropy=None):
+    """Entropy of a session: a new random one, or the given one (e.g. to rerun a session)."""
+    return np.random.SeedSequence(entropy).entropy
+
+
+def session_rng(entropy):
+    """Generator of the session stream (trial types, sides and order)."""
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(1,)))
+
+
+def trial_seed(entropy, trial):
+    """64-bit seed of a trial of a session.
+    :param int entropy: entropy of the session
+    :param int trial: trial number
+    """
+    state = np.random.SeedSequence(entropy, spawn_key=(0, trial)).generate_state(1, np.uint64)
+    return int(state[0])
+
+
+def trial_rngs(seed):
+    """Independent generators of a trial, one per name in STREAMS.
+    :param int seed: trial seed (from `trial_seed`)
+    """
+    children = np.random.SeedSequence(seed).spawn(len(STREAMS))
+    return {name: np.random.default_rng(child) for name, child in zip(STREAMS, children)}
+
+
+def seeded_trial(templates, trial_type, num_tokens, side, seed, format_to='letters'):
+    """The trial of a seed (see `make_trial`), with its 'seed' and the 'side'
+    it was made for (its 'winning_side' can differ when the template allows
+    both winners)."""
+    trial = make_trial(templates, trial_type, num_tokens, side, format_to,
+                       rng=trial_rngs(seed)['sequence'])
+    trial['seed'] = seed
+    trial['side'] = side
+    return trial
+
+
+def session_plan(templates, nr_per_type, nr_random=0, entropy=None, max_type_run=3, max_side_run=3):
+    """Trial type, winning side and seed of each trial of a session, in order.
+    :params dict templates: a dictionary with trial_type as key and the template as value
+    :params int nr_per_type: number of repetitions of each template
+    :params int nr_random: number of trials of randomly chosen types
+    :params int entropy: entropy of the session (optional, default new)
+    :params int max_type_run: longest run of the same trial type
+    :params int max_side_run: longest run of the same winning side
+    :returns: list of (trial_type, side, seed) tuples
+    """
+
+    if entropy is None: entropy = session_entropy()
+    rng = session_rng(entropy)
+    conditions = make_conditions(templates, nr_per_type, nr_random, rng)
+    order = order_conditions(conditions, max_type_run, max_side_run, rng=rng)
+    return [(trial_type, side, trial_seed(entropy, trl)) for trl, (trial_type, side) in enumerate(order)]
+
+
+def seeded_experiment_sequences(templates, num_tokens, nr_per_type, nr_random=0, entropy=None,
+    max_type_run=3, max_side_run=3, format_to='letters'):
+    """Trials of a session (as `ordered_experiment_sequences`), each made
+    from its own seed, created one at a time when needed.
+    :params int num_tokens: the number of tokens (the length of the sequence)
+    :params int entropy: entropy of the session (optional, default new)
+    See `session_plan` for the other parameters.
+    """
+
+    for trial_type, side, seed in session_plan(templates, nr_per_type, nr_random, entropy,
+                                               max_type_run, max_side_run):
+        yield seeded_trial(templates, trial_type, num_tokens, side, seed, format_to)
+
+
+def generate_session(templates, num_tokens, nr_per_type, nr_random=0, entropy=None,
+    max_type_run=3, max_side_run=3, format_to='letters', processes=None):
+    """All the trials of a session, made in parallel (the same trials as
+    `seeded_experiment_sequences` with the same entropy).
+    :params int processes: number of worker processes (optional, default
+        one per CPU; 1 to make the trials in this process)
+    See `seeded_experiment_sequences` for the other parameters.
+    """
+
+    plan = session_plan(templates, nr_per_type, nr_random, entropy, max_type_run, max_side_run)
+    arguments = [(templates, trial_type, num_tokens, side, seed, format_to)
+                 for trial_type, side, seed in plan]
+    if processes == 1 or len(plan) < 2:
+        return [seeded_trial(*x) for x in arguments]
+    from concurrent.futures import ProcessPoolExecutor  #imported here: it loads multiprocessing
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(seeded_trial, *zip(*arguments), chunksize=max(1, len(plan) // 64)))
@@ -0,0 +1,64 @@
+import numpy as np
+from math import ceil, sqrt
+
+"""
+Settings of the sessions, shared by the experiment (tokens.py), the session
+bundles (bundle.py) and the benchmarks: templates, number of trials, limits of the
+trial order and the geometry of the circles and token arrays. A bundle records
+the templates, numbers of trials, run limits and layout it was compiled with, and tokens.py refuses a
+bundle that does not match these settings.
+"""
+
+NUM_TOKENS = 25  #set the number of *desired* tokens inside the main circle
+NR_PER_TYPE = 30
+NR_RANDOM = 30
+# Longest runs of the same trial type and of the same winning side (see ordering.py)
+MAX_TYPE_RUN = 3
+MAX_SIDE_RUN = 3
+TEMPLATES = {
+    'e' : [(.6,1),  (), (.7,1), (), (.8,1), (), (), (), (), (.8,1), (), (), (.9,1), (), ()],
+    'a' : [(),  (.5,.5), (.55,.65), (.5,.5), (.55,.65), (.5,.5), (.55,.65), (.5,.5), (0,.66), (.5,1), (.65,1), (.5,1), (.75,1), (), ()],
+    'm' : [(),  (0,.3),  (0,.4), (0,.5), (), (), (), (), (), (.5,1), (), (), (), (.75,1), (), ()]
+    }
+
+CIRCLE_SIZE = 130  #set the circle diameter
+C_OFFSET = 200  #offset from the center in the x axis for the 2 periph circles
+C_Y_POS = 400
+
+
+def grid_settings(num_tokens, circle_size=CIRCLE_SIZE, c_y_pos=C_Y_POS):
+    """Grid of the token arrays.
+    Inspired by: https://discourse.psychopy.org/t/changing-colors-of-tiles-in-a-grid-psychopy-help/4616/6
+
+    The grid parameters approximate the wanted number of tokens: this adjusts
+    the number of grid lines and therefore the token size. It gives a grid
+    that overshoots `num_tokens` slightly (those extra tokens can be removed later).
+    :param int num_tokens: the number of tokens
+    :param float circle_size: diameter of the circles
+    :param float c_y_pos: y position of the circles
+    :returns: loc (position of the central array), side_tokens, circle_radius, token_size
+    """
+
+    alt_grid_side = ceil(sqrt(num_tokens))
+    grid_side = alt_grid_side*2
+    side_tokens = ceil(grid_side*1.4) #constant is abritrary (NOTE: got 1 error with n=15 now)
+    #set the size of a token
+    token_size = [circle_size / side_tokens, circle_size / side_tokens]
+    #set where the grid is positioned
+    location = [0, c_y_pos]
+    loc = np.array(location) + np.array(token_size) // 2
+    return loc, side_tokens, circle_size / 2, token_size
+
+
+def token_layout(num_tokens, layout='grid', circle_size=CIRCLE_SIZE, c_offset=C_OFFSET, c_y_pos=C_Y_POS):
+    """Layout settings of the trials, as used by `pipeline.prepare_trial`.
+    :param str layout: 'grid' (jittered grid, see create_coordinates) or 'poisson' (Poisson-disc)
+    """
+
+    loc, side_tokens, circle_radius, token_size = grid_settings(num_tokens, circle_size, c_y_pos)
+    return {'layout'       : layout,
+            'loc'          : loc,
+            'side_tokens'  : side_tokens,
+            'circle_radius': circle_radius,
+            'token_size'   : token_size,
+            'c_offset'     : c_offset}
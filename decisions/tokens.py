@@ -1,10 +1,19 @@
-from psychopy import core, visual, event, logging, gui, data
 import numpy as np
-from math import sqrt, ceil, sin
-import random
-import csv, datetime, glob, os
-from tokentools import *
-from visualtools import *
+from math import sin
+import atexit, datetime, os
+from .backends import load_backend
+#PsychoPy, or the headless stand-in with DECISIONS_BACKEND=headless (see backends.py)
+core, visual, event, logging, gui, data = load_backend()
+from .tokentools import check_templates
+from .seeding import session_entropy, seeded_experiment_sequences
+from .pipeline import prepared_trials, prefetch
+from .bundle import load_session, check_session, session_trials
+from .settings import (NUM_TOKENS, NR_PER_TYPE, NR_RANDOM, MAX_TYPE_RUN, MAX_SIDE_RUN, TEMPLATES,
+                       CIRCLE_SIZE, C_OFFSET, C_Y_POS, grid_settings, token_layout)
+from .writer import open_writer, writer_put, close_writer
+from .kinematics import (new_recorder, reset_recorder, record, recorded, last_positions, set_velocity,
+                         window_velocity)
+from .frametiming import new_frame_timer, start_trial, start_frame, mark, end_frame, trial_report, write_timing_report
 
 """
 # Author: Santiago Muñoz Moldes, University of Cambridge
@@ -12,12 +21,6 @@ from visualtools import *
 # Start date: March 2020
 """
 
-""" 
-TODO:
-- save stgs to log file (and add seed)
-- 1.4 constant overshoots heavily for big numbers, find better way
-"""
-
 #=====================
 # 1. GENERAL SETTINGS
 #=====================
@@ -29,14 +32,11 @@ normal_speed = 120//5  #normal moving speed
 fast_speed = 60//20
 frames_per_token = normal_speed
 
-num_tokens = 25 #set the number of *desired* tokens inside the main circle
-nr_per_type = 30
-nr_random = 30
-templates = {
-    'e' : [(.6,1),  (), (.7,1), (), (.8,1), (), (), (), (), (.8,1), (), (), (.9,1), (), ()],
-    'a' : [(),  (.5,.5), (.55,.65), (.5,.5), (.55,.65), (.5,.5), (.55,.65), (.5,.5), (0,.66), (.5,1), (.65,1), (.5,1), (.75,1), (), ()],
-    'm' : [(),  (0,.3),  (0,.4), (0,.5), (), (), (), (), (), (.5,1), (), (), (), (.75,1), (), ()] 
-    }
+# Templates, number of trials and geometry are shared with bundle.py (see settings.py)
+num_tokens = NUM_TOKENS
+nr_per_type = NR_PER_TYPE
+nr_random = NR_RANDOM
+templates = TEMPLATES
 
 # 1.2 Experiment information
 
@@ -80,27 +80,31 @@ dir = 'data'
 filename = dir + os.path.sep + exp_name + '_' + '%s_%s' %(exp_info['id'], exp_info['date']) + '.csv' #generate file name with name of the experiment
 logfile = logging.LogFile(filename[:-3] + 'log', level=logging.EXP)
 
+#write the per-frame data (velocity, path, times) to a binary sidecar
+#(a folder with one .npz per trial) instead of the csv file
+frames_sidecar = False
+
+header = ('exp_name', 'version', 'hz', 'num_tokens', 
+    'normal_speed', 'fast_speed', 'id', 'gender', 
+    'trial', 'type', 'sequence', 'probs', 
+    'correct', 'resp', 'acc', 'rt', 
+    'velocity', 'path', 'times', 'timestamp', 'seed', 'side')
+#rows are written by a background thread (see writer.py)
+writer = open_writer(filename, header, 
+    sidecar=filename[:-4] + '_frames' if frames_sidecar else None)
+
 def write_trial(correct, resp, acc, rt, velocity, path, times):
-    # check if file and folder already exist
-    if not os.path.isdir(dir):
-        os.makedirs(dir) #if this fails (e.g. permissions) you will get an error
-
-    # open file
-    with open(filename, 'a') as save_file: #'a' = append; 'w' = writing; 'b' = in binary mode
-        file_writer = csv.writer(save_file, delimiter=',') #generate file_writer object # delimiter='\t'
-        if os.stat(filename).st_size == 0: #if file is empty, insert header
-            file_writer.writerow(('exp_name', 'version', 'hz', 'num_tokens', 
-                'normal_speed', 'fast_speed', 'id', 'gender', 
-                'trial', 'type', 'sequence', 'probs', 
-                'correct', 'resp', 'acc', 'rt', 
-                'velocity', 'path', 'times', 'timestamp'))
-
-        # write trial
-        file_writer.writerow((exp_name, exp_v, exp_info['screen'], num_tokens, 
-            normal_speed, fast_speed, exp_info['id'], exp_info['gender'], 
-            trl, exp_sequences[trl]['trial_type'], exp_sequences[trl]['token_sequence'], get_prob_vector(exp_sequences[trl]['token_sequence'], num_tokens), #TODO: probs could be slow, 
-            correct, resp, acc, rt, 
-            velocity, path, times, get_timestamp()))
+    frames = None
+    if frames_sidecar:
+        frames = {'trial': trl, 'path': path, 'times': times, 'velocity': velocity}
+        velocity, path, times = '', '', ''  #stored in the sidecar
+
+    # write trial
+    writer_put(writer, (exp_name, exp_v, exp_info['screen'], num_tokens, 
+        normal_speed, fast_speed, exp_info['id'], exp_info['gender'], 
+        trl, trial['trial_type'], trial['token_sequence'], trial['probs'].tolist(), 
+        correct, resp, acc, rt, 
+        velocity, path, times, get_timestamp(), trial['seed'], trial['side']), frames)
 
 
 def get_timestamp(time="", format='%Y-%m-%d %H:%M:%S'): 
@@ -115,11 +119,34 @@ def get_timestamp(time="", format='%Y-%m-%d %H:%M:%S'):
 # X. TOKEN SEQUENCES
 #====================
 
-exp_sequences = experiment_sequences(templates, num_tokens=num_tokens, 
-    nr_per_type=nr_per_type, nr_random=nr_random, randomisation='random', 
-    format_to='letter')
-
-num_trials = nr_per_type*len(templates) + nr_random
+# Every template must fit some sequence: stop here with the reason otherwise
+problems = [problem for problem in check_templates(templates, num_tokens).values() if problem is not None]
+if problems:
+    raise ValueError(' '.join(problems))
+
+# Trial order with at most 3 trials of the same type or of the same winning
+# side in a row, sides balanced within each type (see ordering.py and
+# settings.py). Trials are created one at a time, when needed
+max_type_run = MAX_TYPE_RUN
+max_side_run = MAX_SIDE_RUN
+# Precompiled session: folder of a bundle made offline with bundle.py (all
+# trials and their stimuli arrays, loaded at once), or None to make the
+# trials of a new session here. Also set by `decisions run --bundle`
+session_bundle = os.environ.get('DECISIONS_BUNDLE') or None
+
+if session_bundle is None:
+    # Each trial is made from its own seed (saved in the data), from which its
+    # sequence and layout can be recomputed (see seeding.py)
+    exp_info['session_seed'] = session_entropy()
+    exp_sequences = seeded_experiment_sequences(templates, num_tokens=num_tokens, 
+        nr_per_type=nr_per_type, nr_random=nr_random, entropy=exp_info['session_seed'], 
+        max_type_run=max_type_run, max_side_run=max_side_run, format_to='letters')
+    num_trials = nr_per_type*len(templates) + nr_random
+else:
+    bundle = load_session(session_bundle)
+    exp_info['session_seed'] = bundle['session_seed']
+    num_trials = bundle['num_trials']
+logging.exp('session seed: %s' % exp_info['session_seed'])
 
 #=====================
 # 2. STIMULI CREATION
@@ -137,13 +164,13 @@ yellowish = "#EAD15D"
 whitish = "#F2F2F2"
 
 # 2.1.2 Create 3 big circles
-circle_size = 130  #set the circle diameter
+circle_size = CIRCLE_SIZE  #set the circle diameter
 circle_radius = circle_size/2
 line_color = whitish  #color of the circle border
 line_width = 2.5  #width of the circle border
 line_edges = 256  #number of edges to create the circle
-c_offset = 200  #offset from the center in the x axis for the 2 periph circles
-c_y_pos = 400
+c_offset = C_OFFSET  #offset from the center in the x axis for the 2 periph circles
+c_y_pos = C_Y_POS
 circles = []
 for pos in -c_offset, 0, c_offset:
     circles += [visual.Circle(win, 
@@ -153,20 +180,17 @@ for pos in -c_offset, 0, c_offset:
 #------------------
 # 2.2 TOKEN ARRAYS
 #------------------
-"""Inspired by: https://discourse.psychopy.org/t/changing-colors-of-tiles-in-a-grid-psychopy-help/4616/6
-
-Now set the grid parameters to approximate the wanted number of tokens
-this will adjust the number of grid lines and therefore the token size. 
-it will provide a grid that overshoot the `num_tokens` number slightly
-(those extra tokens can be remove later)"""
-alt_grid_side = ceil(sqrt(num_tokens))
-grid_side = alt_grid_side*2
-side_tokens = ceil(grid_side*1.4) #constant is abritrary (NOTE: got 1 error with n=15 now)
-#set the size of a token
-token_size = [circle_size / side_tokens, circle_size / side_tokens]
-#set where the grid is positioned
-location = [0, c_y_pos]
-loc = np.array(location) + np.array(token_size) // 2
+#grid of the token arrays: position of the central array, number of grid
+#lines and token size (see settings.grid_settings)
+loc, side_tokens, circle_radius, token_size = grid_settings(num_tokens, circle_size, c_y_pos)
+#token layout: 'grid' (jittered grid, see create_coordinates) or 'poisson' (Poisson-disc)
+layout = 'grid'
+#token rendering: 'single' (one array per side for the whole session, tokens
+#shown by changing their opacity) or 'preload' (one array per trial, token and side)
+render_mode = 'single'
+#number of trials prepared in the background while the current one runs 
+#(0 to prepare all trials before starting; always 0 with render_mode 'preload')
+prefetch_size = 2
 
 def make_tokens(xys, indices, pos):
     """Creates an elementArrayStim based on given parameters"""
@@ -186,80 +210,80 @@ def clip(val, min_, max_):
 #- - - - - - - - - -
 # PRELOADING ARRAYS
 #- - - - - - - - - -
-"""Here I create all central token arrays with randomly jittered tokens.
-I first define all positions and then create stimuli arrays."""
-
-# Create empty arrays
-stgs = []
+"""Here I prepare the central token arrays with randomly jittered tokens.
+Positions, index lists (`stgs`) and visibility masks of each trial are 
+computed by `prepare_trial` (see pipeline.py), in the background a few trials
+ahead, unless all stimuli arrays are preloaded. With a session bundle, they
+are read from it instead."""
+
+layout_settings = token_layout(num_tokens, layout, circle_size, c_offset, c_y_pos)
+if session_bundle is None:
+    trials = prepared_trials(exp_sequences, num_tokens, layout_settings)
+else:
+    check_session(bundle, templates, num_tokens, nr_per_type, layout_settings, nr_random,
+                  max_type_run, max_side_run)
+    trials = session_trials(bundle)
+
+# STIMULI. ElementArrays will be stored here (render_mode 'preload').
 stim = []
 
-for trl in range(num_trials):
-
-    # TOKEN SEQUENCE FOR THIS TRIAL
-    token_sequence = exp_sequences[trl]['token_sequence']
-
-    # CREATE COORDINATES
-    xys = create_coordinates(loc, side_tokens, circle_radius, token_size)
-
-    # NOTE: Not sure what the following does...:
-    #tokens.size = (token_size[0] * side_tokens,
-    #               token_size[1] * side_tokens)
-
-    # Reduce xys length to the initially desired number of tokens
-    shortlist = random.sample(range(len(xys)), num_tokens)
-
-    xys = [xys[i] for i in shortlist]
-
-    # SETTINGS
-    # `pos`: main position: central, left or right
-    # `i_all`: indices for all tokens that will go either left or right
-    # `i_now`: indices of tokens that will be shown at a given moment
-    #TODO: stgs[trial]
-    stgs += [{'c' : {
-        'pos'  : loc,
-        'i_all': random.sample(range(len(xys)), num_tokens),  # Shuffle list of indices for the new shortlisted xys list
-        'i_now': [ [] for i in range(num_tokens) ]  #TODO: Extend for each `this_token`, maybe make this an indexed list
-        }, 
-            'l'   : {
-        'pos'  : (loc - (c_offset, 0)),
-        'i_all': [i for i, x in enumerate(token_sequence) if x == 'l'],
-        'i_now': [ [] for i in range(num_tokens) ] 
-        },
-            'r'  : {
-        'pos'  : (loc + (c_offset, 0)),
-        'i_all': [i for i, x in enumerate(token_sequence) if x == 'r'],
-        'i_now': [ [] for i in range(num_tokens) ] 
-        }
-    }]
-
-    # STIMULI. ElementArrays will be stored here.
-    stim += [{'c' : [ [] for i in range(num_tokens) ],
-              'l' : [ [] for i in range(num_tokens) ],
-              'r' : [ [] for i in range(num_tokens) ]}]
-
-    # Create and store stim at each side at each moment in time
-    for this_token in range(num_tokens):
-        # 1. Update array indices
-        for side in 'l', 'r':
-            stgs[trl][side]['i_now'][this_token] = [t for t in stgs[trl][side]['i_all'] if t <= this_token]
-        # Now remove the sides indices from the center indices
-        sides = stgs[trl]['l']['i_now'][this_token] + stgs[trl]['r']['i_now'][this_token]
-        stgs[trl]['c']['i_now'][this_token] = [x for x in stgs[trl]['c']['i_all'] if x not in sides]
-        # 2. Set each side's array stim using the indices
-        for i_pos in stgs[trl]:
-            if stgs[trl][i_pos]['i_now'][this_token]:  #test whether list is not empty
-                stim[trl][i_pos][this_token] = make_tokens(
-                    xys=xys, 
-                    indices=stgs[trl][i_pos]['i_now'][this_token], 
-                    pos=stgs[trl][i_pos]['pos'])
-
-    # Add also the full array at the end of each trial list  # `trl` will always give the +1
-    stim[trl]['c'] += [make_tokens(xys=xys, 
-                              indices=stgs[trl]['c']['i_all'], 
-                              pos=stgs[trl]['c']['pos'])]
-
-    # Save stgs to file
-    # NOTE: TODO.
+if render_mode == 'preload' or prefetch_size == 0:
+    trials = list(trials)  #prepare everything before the first trial
+
+    for trl in range(num_trials if render_mode == 'preload' else 0):
+        stgs = trials[trl]['stgs']
+        xys = trials[trl]['xys']
+
+        stim += [{'c' : [ [] for i in range(num_tokens) ],
+                  'l' : [ [] for i in range(num_tokens) ],
+                  'r' : [ [] for i in range(num_tokens) ]}]
+
+        # Create and store stim at each side at each moment in time
+        for this_token in range(num_tokens):
+            # Set each side's array stim using the indices
+            for i_pos in stgs:
+                if stgs[i_pos]['i_now'][this_token]:  #test whether list is not empty
+                    stim[trl][i_pos][this_token] = make_tokens(
+                        xys=xys, 
+                        indices=stgs[i_pos]['i_now'][this_token], 
+                        pos=stgs[i_pos]['pos'])
+
+        # Add also the full array at the end of each trial list  # `trl` will always give the +1
+        stim[trl]['c'] += [make_tokens(xys=xys, 
+                                  indices=stgs['c']['i_all'], 
+                                  pos=stgs['c']['pos'])]
+
+        # Save stgs to file
+        # NOTE: TODO.
+
+    trials = iter(trials)
+elif session_bundle is None:
+    trials = prefetch(trials, size=prefetch_size)
+
+if render_mode == 'single':
+    # One array per side for the whole session: positions are set at the start
+    # of each trial and opacities at each token (see show_tokens)
+    token_arrays = {}
+    for side, offset in ('c', 0), ('l', -c_offset), ('r', c_offset):
+        token_arrays[side] = make_tokens(xys=np.zeros((num_tokens, 2)), indices=range(num_tokens), 
+                                         pos=loc + np.array((offset, 0)))
+
+def show_tokens(trial, this_token):
+    """Sets the tokens of the session arrays that are visible at a given 
+    moment of a trial (`num_tokens` for the full central array)"""
+    for side in token_arrays:
+        token_arrays[side].opacities = trial['masks'][side][this_token]
+
+def draw_tokens(trl, trial, this_token):
+    """Draws the token arrays of a given moment of a trial"""
+    if render_mode == 'single':
+        for side in token_arrays:
+            if trial['masks'][side][this_token].any():  #test whether any token is visible
+                token_arrays[side].draw()
+    else:
+        for s in stim[trl]:
+            if this_token < len(stim[trl][s]) and stim[trl][s][this_token]:  #test whether list is not empty
+                stim[trl][s][this_token].draw()
 
 #----------------------
 # 2.3 RESPONSE STIMULI
@@ -280,6 +304,15 @@ cursor = visual.Circle(win,
 #TODO: change depending on initial hz
 t_in_frames = 15
 
+#arrays for the mouse path, timestamps and velocity, allocated once for the
+#longest possible trial (see kinematics.py)
+kinematics = new_recorder(num_tokens*normal_speed)
+
+#time spent in each phase of each frame, and dropped frames (see frametiming.py)
+frame_timer = new_frame_timer(num_tokens*normal_speed, refresh_rate=exp_info['screen'])
+timing_filename = filename[:-4] + '_timing.json'
+atexit.register(write_timing_report, frame_timer, timing_filename)  #also when quitting with core.quit()
+
 #stimuli for cursor shadow
 shadow_length = 10
 shadow_stim = []
@@ -293,7 +326,7 @@ for i in range(shadow_length):
 # Moving drawing area
 #- - - - - - - - - - -
 
-draw_area_coord = (cursor_start_y_pos, location[1]-circle_radius)  # top, bottom
+draw_area_coord = (cursor_start_y_pos, c_y_pos-circle_radius)  # top, bottom
 draw_rect_height = abs(abs(draw_area_coord[1]) - draw_area_coord[0])  # top - bottom
 draw_rect_x = 0 #-(c_offset+circle_size)  #on the left side
 draw_rect_y = draw_area_coord[1] - draw_rect_height/2
@@ -332,9 +365,7 @@ speed_warning = visual.TextStim(win,
 for trl in range(num_trials):
 
     # 3.1 Reset some values at each trial
-    trl_path  = []  #tuples for x,y pos (variable length each trial)
-    trl_times = []  #timestamp for each recorded position
-    trl_velocity = []  #velocity values calculated each time point
+    reset_recorder(kinematics)  #x,y pos, timestamps and velocity of each frame
     for side in 0, 2: 
         circles[side].setLineColor(line_color)  #reset colors
         circles[side].setLineWidth(line_width)  #reset line width
@@ -353,7 +384,12 @@ for trl in range(num_trials):
     timer = core.Clock()  #start a trial timer
 
     # 3.2 Set some trial information
-    correct_side = exp_sequences[trl]['winning_side']
+    trial = next(trials)  #prepared in advance
+    correct_side = trial['winning_side']
+    if render_mode == 'single':
+        for side in token_arrays:
+            token_arrays[side].xys = trial['xys']
+        show_tokens(trial, num_tokens)  #full central array
 
     # Set sequence
 
@@ -369,7 +405,7 @@ for trl in range(num_trials):
         for c in circles:
             c.draw()
         #draw the full central array
-        stim[trl]['c'][num_tokens].draw()
+        draw_tokens(trl, trial, num_tokens)
 
         #flip to the screen while mouse not on position
         win.flip()
@@ -385,10 +421,13 @@ for trl in range(num_trials):
     event.Mouse(visible=False)  #make mouse disappear
     #mouse.setPos([0, cursor_start_y_pos])
     timer.reset()  #restart the trial timer
+    start_trial(frame_timer)
     for this_token in range(num_tokens):
         #detect whether this is the last token for special case
         if this_token == num_tokens-1: 
             last_token = True
+        if render_mode == 'single':
+            show_tokens(trial, this_token)
 
         #===============
         # 5. FRAME LOOP
@@ -398,6 +437,7 @@ for trl in range(num_trials):
 
         for this_frame in range(frames_per_token):
             # 5.0 Detect whether this is the last token (for special case)
+            start_frame(frame_timer)
             if this_frame == frames_per_token-1 and last_token: 
                 last_frame = True
 
@@ -411,21 +451,19 @@ for trl in range(num_trials):
                 area.height = new_height
                 area.setPos((draw_rect_x, new_y))
                 area.draw()
+            mark(frame_timer, 'area')
 
             # 5.2 Update mouse and cursor
             #5.2.1 Get mouse position and, if needed, set within limits
             m_x, m_y = mouse.getPos()
             #5.2.2 Store mouse position
-            trl_path.append((m_x, m_y))  # record current mouse positions
-            trl_times.append(round(timer.getTime(), 4))  # record time of mouse position
+            record(kinematics, m_x, m_y, round(timer.getTime(), 4))  # record current mouse position and its time
 
             #5.2.3 Calculate mouse velocity
             #distance between last and previous recorded coordiantes (between two frames)
             # time in frames for the duration of the travel
-            if len(trl_path) > t_in_frames and not responded:  # start measuring after a time minimum
-                velocity = sqrt((trl_path[-1][0] - trl_path[-t_in_frames][0])**2 + 
-                                (trl_path[-1][1] - trl_path[-t_in_frames][1])**2)
-                velocity = round(velocity, 3)
+            if kinematics['n'] > t_in_frames and not responded:  # start measuring after a time minimum
+                velocity = round(window_velocity(kinematics, t_in_frames), 3)
                 if velocity > 0:
                     moving = True
                     #cursor.setFillColor('white')
@@ -440,14 +478,15 @@ for trl in range(num_trials):
 
             else: velocity = 'NA'
 
-            trl_velocity.append(velocity)  # record velocity values
+            if velocity != 'NA': set_velocity(kinematics, velocity)  # record velocity values
+            mark(frame_timer, 'mouse')
 
             #5.2.4 Prepare cursor visualisation
 
             # a. cursor shadow
             if show_shadow:
-                if len(trl_path) > shadow_length:
-                    shadow_pos = trl_path[-shadow_length:]
+                if kinematics['n'] > shadow_length:
+                    shadow_pos = last_positions(kinematics, shadow_length)
                     for i, pos in enumerate(shadow_pos):
                         shadow_stim[i].setPos(pos) 
                         shadow_stim[i].setOpacity(1/shadow_length*(i+1))
@@ -462,11 +501,11 @@ for trl in range(num_trials):
             #set new position
             cursor.setPos([m_x, m_y])
             if show_cursor: cursor.draw()
+            mark(frame_timer, 'cursor')
 
             # 5.3 Update the current token array
-            for s in stim[trl]:
-                if stim[trl][s][this_token]:  #test whether list is not empty
-                    stim[trl][s][this_token].draw()
+            draw_tokens(trl, trial, this_token)
+            mark(frame_timer, 'tokens')
 
             # 5.4 Special case after response or missed response
             # if responded, go through all remaining tokens but faster
@@ -486,6 +525,8 @@ for trl in range(num_trials):
                         
             if not responded and last_token:
                 #no response, "too slow" message or similar
+                if last_frame:
+                    trial_report(frame_timer, trl)
                 continue
 
             # 5.5 Draw static big circles
@@ -500,24 +541,31 @@ for trl in range(num_trials):
                 else: circles[side].setLineWidth(line_width)
             for c in circles:
                 c.draw()
+            mark(frame_timer, 'response')
 
             # 5.6 Flip everything that has been drawn on screen
             win.flip()
+            end_frame(frame_timer)
 
             # 5.7 Ask for manual input if trial ended
             if last_token and last_frame:
                 #save trial information
                 
+                trial_report(frame_timer, trl)
+                trl_path, trl_times, trl_velocity = recorded(kinematics)
                 write_trial(correct=correct_side, 
                             resp=sel_side_letter, 
                             acc=1 if sel_side_letter==correct_side else 0,
                             rt=rt,
                             velocity=trl_velocity, 
                             path=trl_path, 
-                            times=trl_times) # TODO: maybe not fast
+                            times=trl_times)
 
                 #require manual input to continue
                 keypress = event.waitKeys(keyList=['space', 'escape'])
 
             # 5.8 Continously allow to quit if escape is pressed
-            if event.getKeys(['escape']): core.quit()
\ No newline at end of file
+            if event.getKeys(['escape']): core.quit()
+
+# Write the remaining trials (the frame timing report is written at exit)
+close_writer(writer)
@@ -0,0 +1,752 @@
+import hashlib
+import json
+import os
+import random
+import numpy as np
+from functools import lru_cache
+from math import floor, factorial
+from .probtable import get_prob_table, get_prob_array, get_NL_range, prob_right, TABLE_MAX_TOKENS
+
+
+def letters_or_digits(s):
+    return 'letters' if s.isalpha() else 'digits'
+
+
+def get_quantities(sequence, length = None, stop = None):
+    """
+    Function for calculating NC, NR, and NL from a given sequence.
+    :param str sequence: sequence of left-right movements
+    :param int length: the full length of the sequence (optional, default is len(sequence))
+    :param int length: moment of the sequence where qtes are taken (optional, default is at the end)
+    """
+    # Check if sequence entered correctly
+    try: isinstance(sequence, str)
+    except AssertionError: print("The sequence should be in `string` format.")
+
+    if stop is not None:
+        try: length is not None
+        except AssertionError:
+            print("If an optional `stop` is provided, the full sequence `length` is required.")
+
+    if length is None: length = len(sequence)
+    if stop is None: stop = len(sequence)
+
+    NC = length - stop  # Number of tokens remaining is equal to total number - stop TODO: stop+1?
+    if letters_or_digits(sequence) == 'digits':
+        NR = sequence.count('2')
+    elif letters_or_digits(sequence) == 'letters': 
+        NR = sequence.count('r')
+
+    NL = length - (NC + NR)
+    return NC, NR, NL
+
+
+def get_prob(NC, NL, num_tokens):
+    """Function for calculating the success probability of guessing right 
+    (Cisek et al. 2009). Given a total number of tokens, the number of remaining 
+    tokens in the center, moved tokens to the LEFT, calculate the probability 
+    that RIGHT response is correct.
+    Values are looked up in the precomputed table for `num_tokens` (see
+    probtable.py), or computed in log space for long sequences (above
+    TABLE_MAX_TOKENS); `get_prob_formula` is the direct calculation."""
+
+    high_bound = min(NC, floor(num_tokens/2)-NL)  #the higher bound for the summation
+    if high_bound < 0:  # empty summation
+        return 0.0
+    if num_tokens > TABLE_MAX_TOKENS or NC > num_tokens:  # no table (or outside of it)
+        return float(prob_right(NC, NL, num_tokens))
+    return get_prob_table(num_tokens)[NC][high_bound]
+
+
+def get_prob_formula(NC, NL, num_tokens):
+    """Direct calculation of p(r) with the formula of Cisek et al. 2009, 
+    without using the precomputed tables."""
+
+    # First part of the formula
+    first_part = factorial(NC)/(2**NC)
+    # Summation part of the formula
+    high_bound = min(NC, floor(num_tokens/2)-NL)  #the higher bound for the summation
+    summation = sum([1/(factorial(k)*factorial(NC - k)) for k in range(0, high_bound+1)])
+    # Probability that 'Right' response is correct given the sequence history
+    p_r = round(first_part * summation, 2)
+    return p_r
+
+
+def get_prob_vector(sequence, num_tokens):
+    """Function to calculate the p(r)) at each step of a given
+    sequence."""
+
+    probs = []
+    # Calculate the success probability after each token movement
+    for stop in range(0, len(sequence) + 1):
+        # Take part of the sequence
+        sequence_part = sequence[:stop]
+        # Obtain the variables for the formula
+        NC, NR, NL = get_quantities(sequence=sequence_part, length=num_tokens, stop=stop)
+        # Formula
+        p_r = get_prob(NC, NL, num_tokens)
+        #print('center:' + str(NC) + ', right:' + str(NR) + ', left:' + str(NL) + ', P(R):' + str(round(P_R, 2)))
+        probs += [p_r]
+    return probs
+
+
+def sequences_to_array(sequences):
+    """Function to convert text sequences into a 2-D integer array, with one
+    row per sequence, 1 for a token moving right and 0 for a token moving left.
+    :param list sequences: sequences of equal length, in letters or digits
+    """
+
+    if len(sequences) == 0:
+        return np.zeros((0, 0), dtype=np.uint8)
+    # Encode all sequences at once as bytes, then compare to the right codes
+    codes = np.frombuffer(''.join(sequences).encode('ascii'), dtype=np.uint8)
+    codes = codes.reshape(len(sequences), -1)
+    return ((codes == ord('r')) | (codes == ord('2'))).astype(np.uint8)
+
+
+def get_prob_matrix(sequences, num_tokens):
+    """Function to calculate the p(r) at each step of many sequences at once.
+    Equivalent to calling `get_prob_vector` on each sequence, but done in a
+    single NumPy pass using cumulative sums of the right movements.
+    :param sequences: 2-D integer array (1 = right, 0 = left), or a list of
+        text sequences of equal length
+    :param int num_tokens: the number of tokens
+    :returns: array of shape (number of sequences, sequence length + 1)
+    """
+
+    if not isinstance(sequences, np.ndarray):
+        sequences = sequences_to_array(sequences)
+    sequences = np.atleast_2d(sequences)
+    n_seq, length = sequences.shape
+
+    # NR after each stop (stop=0 is before any movement)
+    NR = np.zeros((n_seq, length + 1), dtype=np.int64)
+    np.cumsum(sequences != 0, axis=1, out=NR[:, 1:])
+    stops = np.arange(length + 1)
+    NC = num_tokens - stops  # same for all sequences
+    NL = stops - NR  # equal to num_tokens - (NC + NR)
+    return get_probs(NC, NL, num_tokens)
+
+
+def get_probs(NC, NL, num_tokens):
+    """Same as `get_prob` for arrays of NC and NL (that broadcast together).
+    :param NC: tokens remaining at the center
+    :param NL: tokens moved to the left
+    :param int num_tokens: the number of tokens
+    """
+
+    NC, NL = np.broadcast_arrays(np.asarray(NC, dtype=np.int64), np.asarray(NL, dtype=np.int64))
+    if num_tokens > TABLE_MAX_TOKENS:  # log-space engine, no table
+        return prob_right(NC, NL, num_tokens)
+    high_bound = np.minimum(NC, num_tokens // 2 - NL)
+    table = get_prob_array(num_tokens)
+    probs = table[NC, np.clip(high_bound, 0, num_tokens)]
+    probs[high_bound < 0] = 0.0  # empty summation
+    return probs
+
+
+def extend_template(template, t_type, new_length):
+    """Function for extending the size of each template.
+    :param list template: a list of  min_p_r, max_p_r tuples
+    :param str t_type: the type of trial ('e', 'a' or 'm')
+    :param int new_length: the new length of the template"""
+
+    old_length = len(template)
+    extended_template = [tuple()] * new_length  #output
+
+    if t_type == 'e' or t_type == 'm' : 
+        """Similar to an interpolation"""
+
+        # Find pos of each filled item
+        old_pos = [i for i,x in enumerate(template) if x is not tuple()]
+        # Calculate normalized [0-1] position
+        adj_pos = [old_pos / old_length for old_pos in old_pos]
+        # New positions
+        new_pos = [round(pos * new_length) for pos in adj_pos]
+
+        for i in range(new_length):
+            if i in new_pos:
+                #find idx of i in new_pos (and old_pos)
+                idx = new_pos.index(i)
+                # that gives the pos
+                pos = old_pos[idx]
+                # we take value corresponding to pos
+                extended_template[i] = template[pos]
+
+        # Manually adjust some p values depending on num_tokens 
+        # For instance in easy, first movement gives a p = get_prob(num_tokens-1,0,num_tokens)
+        # (goes right); in misleading, it goes left, as the template leans left first
+        if t_type == 'e':
+            extended_template[0] = (get_prob(new_length-1, 0, new_length), 1)
+        else:
+            extended_template[0] = (0, get_prob(new_length-1, 1, new_length))
+
+    elif t_type == 'a': 
+        #Ambiguous sequence. Hits p=0.5 in alternate trials for 2/3 of the trial.
+        #Then it starts increasing to one side.
+
+        flip_point_1 = round((new_length/3)*2) #find pos of 2/3 start
+        flip_point_2 = round((new_length/6)*5) #find pos of 5/6 start
+        # For the 1st part:
+        positions = np.arange(0, flip_point_1)
+        NC = new_length-(positions+1)
+        NL = (positions+1)//2
+        for pos, p_r in enumerate(get_probs(NC, NL, new_length).tolist()):
+            # if pos%2:  # Even
+            extended_template[pos] = (p_r, p_r)
+            # if not pos%2:  # Odd
+            #     extended_template[pos] = (.5, .5)
+        # For the 2nd part:
+        #for pos in range(flip_point, new_length):
+            # increase by the factor allowed by the n_tokens/p calculation
+            # NC = new_length-(pos+1)
+            # NL = floor((pos+1)/2)  # Min
+        extended_template[flip_point_1] = (.5, 1)
+        extended_template[flip_point_2] = (.75, 1)
+        extended_template[new_length-1] = (1, 1)
+
+    return extended_template
+
+
+def get_NL(num_tokens, NC, prob_min, prob_max):
+    """Returns which NL values provide a p(r) contained within a 
+    p(r) range.
+    :param int num_tokens: length of the sequence
+    :param int NC: tokens remaining at the center
+    :param float prob_min: minimum p(r)
+    :param float prob_max: maximum p(r)
+    """
+
+    NL_range = get_NL_range(num_tokens, NC, prob_min, prob_max)
+    if NL_range is None:
+        raise ValueError('No NL gives a p(r) between %s and %s with NC=%s and num_tokens=%s.'
+                         % (prob_min, prob_max, NC, num_tokens))
+    NL_min, NL_max = NL_range
+    return NL_min, NL_max
+
+
+def get_NL_scan(num_tokens, NC, prob_min, prob_max):
+    """Same as `get_NL`, by trying every possible NL (reference version)."""
+
+    accepted_NL_values = []
+    # Loop for different values of NL to find those that work
+    for possible_NL in range(num_tokens):
+        p_r = get_prob(NC, possible_NL, num_tokens)
+       # print('p_r: ' + str(p_r) + ',  not higher than ' + str(prob_min) + ' and lower than ' + str(prob_max) +' : ' + str(p_r >= prob_min and p_r <= prob_max) )
+        if p_r >= prob_min and p_r <= prob_max:
+            accepted_NL_values += [possible_NL]
+        else: 
+            continue
+    #count NLs to get valid range of min,max
+    NL_min = min(accepted_NL_values)
+    NL_max = max(accepted_NL_values)
+    return NL_min, NL_max
+
+
+def get_ranges(extended_template):
+    """Function to translate the probability template into actual token 
+    quantity ranges (of NR)"""
+
+    ranges = []
+    num_tokens = len(extended_template)
+    for i, x in enumerate(extended_template):  #start backwards [::-1]
+        if not x: # If x==[]
+            ranges += [tuple()]  #[((),)]  #empty tuple
+            continue
+        else:
+            NC = num_tokens - (i+1)
+            #we have NC, find NL so that get_prob()> x < 1 
+            #(find range of NL min and NR max), and take a value in range randomly
+            NL_min, NL_max = get_NL(num_tokens=num_tokens, NC=NC, prob_min=x[0], prob_max=x[1])
+            NR_min = num_tokens - (NC + NL_max) 
+            NR_max = num_tokens - (NC + NL_min) 
+            #Save tuple in vector
+            ranges += [(NR_min, NR_max)]
+    return ranges
+
+
+def fill_in(ranges):
+    """A function to fill empty tuples inbetween known ranges.
+    :params list ranges: a list of empty and non-empty ranges/tuples
+    
+    1) A given minimum cannot be lower than a previous minimum.
+    We set all unknown item's minima to the previous known minimum.
+    2) An unknown maximum cannot be more than +1 of a previous known maximum.
+    We set all unknown maxima to +1 of the previous known maximum.
+
+    Known ranges are kept as they are (see `propagate_ranges` for the
+    tightest ranges). Done in one backward pass (to find the next known
+    range of each empty slot) and one forward pass."""
+
+    # Index of the next known range, from each position
+    next_known = [None] * len(ranges)
+    following = None
+    for i in range(len(ranges) - 1, -1, -1):
+        if ranges[i]:
+            following = i
+        next_known[i] = following
+    if following is None:
+        raise ValueError('The list of ranges has no known range to fill in from.')
+
+    filled_ranges = []
+    for i, x in enumerate(ranges):
+        if x:  #continue until finding empty slot
+            filled_ranges += [x]
+            continue
+        found_left = i > 0
+        found_right = next_known[i] is not None
+        if found_left:
+            left_min, left_max = filled_ranges[i-1]
+        if found_right:
+            next_index = next_known[i]
+            right_min, right_max = ranges[next_index]
+        if not found_left:
+            new_min = right_min - (next_index-i)  #  bc only 1 jump per timepoint allowed
+            new_max = right_max  # cannot be more than the following max
+        elif not found_right:
+            new_min = left_min
+            new_max = left_max + 1
+        else:
+            # at least the previous min, and only 1 jump per timepoint allowed
+            new_min = max(left_min, right_min-(next_index-i))
+            # maximum +1 from previous maximum, and not more than the following max
+            new_max = min(left_max + 1, right_max)
+        filled_ranges += [(new_min, new_max)]
+    return filled_ranges
+
+
+def propagate_ranges(ranges, start=0):
+    """Fills in and tightens NR ranges so that every NR value left in a range
+    is on at least one valid path. A path starts at NR=`start` before the
+    first token and each token adds 0 (left) or 1 (right), so
+    - forward: NR_min[i] >= NR_min[i-1] and NR_max[i] <= NR_max[i-1] + 1
+    - backward: NR_max[i] <= NR_max[i+1] and NR_min[i] >= NR_min[i+1] - 1
+    Each rule is applied in one linear pass. Any conflict shows up in the
+    forward pass, as a range left empty.
+    :params list ranges: a list of empty and non-empty (NR_min, NR_max) tuples
+    :params int start: NR before the first token
+    :returns: tuple of (NR_min, NR_max) tuples
+    :raises ValueError: if no valid path exists, naming the ranges that
+        require the conflicting minimum and maximum
+    """
+
+    num_tokens = len(ranges)
+    lows, highs = [0] * num_tokens, [0] * num_tokens
+    # Position of the range each bound comes from (-1: the start)
+    low_from, high_from = -1, -1
+    low, high = start, start
+    for i, x in enumerate(ranges):
+        high += 1
+        if x and x[0] > low:
+            low, low_from = x[0], i
+        if x and x[1] < high:
+            high, high_from = x[1], i
+        if low > high:
+            def source(position):
+                if position < 0:
+                    return 'the start (NR=%s before the first token)' % start
+                return 'the range %s at position %s' % (tuple(ranges[position]), position)
+            raise ValueError('No valid NR at position %s: NR >= %s because of %s, '
+                             'but NR <= %s because of %s (at most one right move per token).'
+                             % (i, low, source(low_from), high, source(high_from)))
+        lows[i], highs[i] = low, high
+
+    for i in range(num_tokens - 2, -1, -1):
+        highs[i] = min(highs[i], highs[i+1])
+        lows[i] = max(lows[i], lows[i+1] - 1)
+    return tuple(zip(lows, highs))
+
+
+# Version of the compilation of templates, part of the on-disk cache key:
+# increase it whenever extend_template, get_ranges or propagate_ranges change
+# their result, so that files compiled by older code are not used
+COMPILE_VERSION = 2
+
+
+def template_hash(template, t_type, num_tokens):
+    """Returns a short hash identifying a compiled template (and the version
+    of the code that compiled it, COMPILE_VERSION)."""
+    key = repr((COMPILE_VERSION, tuple(tuple(x) for x in template), t_type, num_tokens))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+@lru_cache(maxsize=256)
+def _compile_template(template, t_type, num_tokens, cache_dir, strict):
+    """Cached body of `compile_template` (template given as a tuple)."""
+
+    if cache_dir is not None:
+        path = cache_dir + os.path.sep + 'template_%s.json' % template_hash(template, t_type, num_tokens)
+        if os.path.isfile(path):
+            with open(path, 'r') as template_file:
+                return tuple(tuple(x) for x in json.load(template_file))
+
+    # 1. Extend if necessary
+    extended_template = extend_template(list(template), t_type=t_type, new_length=num_tokens)
+    # 2. From template calculate plausible ranges
+    ranges = get_ranges(extended_template)
+    # 3. Fill in empty information with what we know from ranges
+    try:
+        filled_ranges = propagate_ranges(ranges)
+    except ValueError as error:
+        if strict:
+            raise ValueError('Template %r is infeasible with %s tokens. %s' % (t_type, num_tokens, error))
+        return tuple(tuple(x) for x in fill_in(ranges))  # not stored on disk
+
+    if cache_dir is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(path, 'w') as template_file:
+            json.dump(filled_ranges, template_file)
+    return filled_ranges
+
+
+def compile_template(template, t_type, num_tokens, cache_dir=None, strict=True):
+    """Function to obtain the filled NR ranges of a template (extend_template,
+    get_ranges and propagate_ranges). The result only depends on the
+    arguments, so it is computed once and kept in a bounded LRU cache, and
+    optionally stored on disk under a hash of the template.
+    :param list template: a list of min_p_r, max_p_r tuples
+    :param str t_type: the type of trial ('e', 'a' or 'm')
+    :param int num_tokens: the number of tokens
+    :param str cache_dir: folder for the on-disk cache (optional)
+    :param bool strict: raise a ValueError if no sequence fits the template
+        (default), otherwise return the `fill_in` ranges of an infeasible
+        template (for the coin-toss walk of `make_NR_sequence`)
+    """
+
+    template = tuple(tuple(x) for x in template)
+    return _compile_template(template, t_type, num_tokens, cache_dir, strict)
+
+
+def check_templates(templates, num_tokens):
+    """Checks that some sequence fits each template.
+    :param dict templates: a dictionary with trial_type as key and the template as value
+    :param int num_tokens: the number of tokens
+    :returns: dict with None for the feasible templates and the reason for the others
+    """
+
+    problems = {}
+    for t_type, template in templates.items():
+        try:
+            compile_template(template, t_type[0], num_tokens)
+            problems[t_type] = None
+        except ValueError as error:
+            problems[t_type] = str(error)
+    return problems
+
+
+def clear_compiled_templates():
+    """Empties the in-memory cache of compiled templates."""
+    _compile_template.cache_clear()
+
+
+def make_NR_sequence(filled_ranges, rng=None):
+    """A function to create a sequence of NR values.
+    :params filled_ranges list: list with ranges from fill_in()
+    :params rng: a numpy Generator (optional, default the random module)
+    """
+    coin = (lambda: random.randint(0, 1)) if rng is None else (lambda: int(rng.integers(2)))
+    sequence = []
+    for i, x in enumerate(filled_ranges):
+        if x[0] == x[1]:
+            value = x[0]
+        else:
+            if i is 0:
+                value = coin()
+            if i is not 0:
+                previous_value = sequence[i-1]
+                #If previous_value is lower than the current minimum, mandatory to add 1
+                if previous_value == (x[0] - 1):
+                    value = previous_value + 1
+                # If previous value is within the current range, then it's random
+                elif previous_value in range(x[0], x[1]):
+                    # Coin toss 
+                    value = previous_value + coin()
+        sequence += [value] 
+    return sequence
+
+
+@lru_cache(maxsize=256)
+def path_tables(filled_ranges, p_right=.5):
+    """Dynamic-programming tables for sampling NR sequences (paths) through
+    the corridor of `filled_ranges`, where each step adds 0 (left) or 1 
+    (right) to NR, starting from NR=0 before the first token.
+
+    Paths are counted backwards: weights[i][v] is the (relative) weighted
+    number of valid paths from NR=v at position i to the end, each right step
+    weighted by p_right and each left step by 1-p_right (p_right=.5 gives the
+    same weight to every valid path). From these, up_probs[i] gives the
+    probability of a right step at position i for each previous NR value,
+    indexed by previous NR - (minimum at i - 1).
+    Tables are cached per `filled_ranges` (a tuple, as from compile_template).
+    :params tuple filled_ranges: tuple with ranges from compile_template()
+    :params float p_right: weight of a right step (optional, default .5)
+    :returns: list of (offset, up_probs) tuples, one per position
+    """
+
+    num_tokens = len(filled_ranges)
+    for i, (low, high) in enumerate(filled_ranges):
+        if low > high:
+            raise ValueError('Empty NR range (%s, %s) at position %s.' % (low, high, i))
+
+    up_tables = [None] * num_tokens
+    # Paths from the last position: 1 for every value in range
+    low, high = filled_ranges[-1]
+    weights = np.ones(high - low + 1)
+    for i in range(num_tokens - 1, -1, -1):
+        low, high = filled_ranges[i]
+        # Weights of `stay` and `up` for each previous value in [low-1, high]
+        padded = np.concatenate(([0.], weights, [0.]))
+        stay = (1 - p_right) * padded[:-1]
+        up = p_right * padded[1:]
+        total = stay + up
+        up_probs = np.divide(up, total, out=np.zeros_like(up), where=total > 0)
+        up_tables[i] = (low - 1, up_probs)
+        if i == 0:
+            break
+        # Weights for the previous position
+        previous_low, previous_high = filled_ranges[i-1]
+        values = np.arange(previous_low, previous_high + 1)
+        in_reach = (values >= low - 1) & (values <= high)
+        weights = np.zeros(len(values))
+        weights[in_reach] = total[values[in_reach] - (low - 1)]
+        if not weights.any():
+            raise ValueError('No valid NR path from position %s %s to position %s %s.' 
+                             % (i-1, filled_ranges[i-1], i, filled_ranges[i]))
+        weights /= weights.max()  # only relative weights are needed
+
+    # The path starts at NR=0 before the first token
+    low, high = filled_ranges[0]
+    if not (low - 1 <= 0 <= high) or total[0 - (low - 1)] == 0:
+        raise ValueError('No valid NR path starts at position 0 %s.' % (filled_ranges[0],))
+    return up_tables
+
+
+def sample_NR_sequence(filled_ranges, p_right=.5, rng=None):
+    """A function to create a sequence of NR values, drawn uniformly from all
+    the valid paths through `filled_ranges` (or weighted by p_right per right
+    step), in a single pass and without retries.
+    :params filled_ranges list: list with ranges from compile_template()
+    :params float p_right: weight of a right step (optional, default .5)
+    :params rng: a numpy Generator (optional, default the random module)
+    """
+
+    up_tables = path_tables(tuple(tuple(x) for x in filled_ranges), p_right)
+    draw = random.random if rng is None else rng.random
+    sequence = []
+    value = 0
+    for offset, up_probs in up_tables:
+        value += draw() < up_probs[value - offset]
+        sequence += [int(value)]
+    return sequence
+
+
+def switch_alpha_digit(text_sequence):
+    """A function to invert letters and digits.
+    :params str text_sequence: a left/right sequence in text format
+    """
+    # Check if digits or letters
+    codes=[]
+    if text_sequence.isdigit(): 
+        codes = [['1', 'l'], ['2', 'r']]  # 3 steps with placeholder as a little hack
+    elif text_sequence.isalpha():
+        codes = [['l', '1'], ['r', '2']]
+    switched_sequence = text_sequence
+    for x,y in (codes): 
+        switched_sequence = switched_sequence.replace(x, y)
+    return switched_sequence
+
+
+def make_sequence(nr_sequence, format_to='letters'):
+    """Given a sequence with the number of NR, create a sequence indicating
+    whether a token goes left or right (e.g. lrrlrlrrl).
+    :params str nr_sequence: a sequence of NR values
+    :params str format_to: output the sequence as 'letters' (default) or 'digits'
+    """
+
+    text_sequence = ''
+    counter = 0
+    for i, x in enumerate(nr_sequence):
+        NC = len(nr_sequence) - (i+1)
+        NL = len(nr_sequence) - (NC+x)
+        if i is 0 and x is 1:
+            text_sequence += 'r'
+        elif i is 0 and x is not 1:
+            text_sequence += 'l'
+        if i>0:
+            if nr_sequence[i-1]+1 == x:
+                text_sequence += 'r'
+            elif nr_sequence[i-1] == x:
+                text_sequence += 'l'
+    # If asked for digit format, we convert to digit, otherwise do nothing
+    if format_to=='letters':
+        pass
+    elif format_to=='digits':
+        text_sequence = switch_alpha_digit(text_sequence)
+    return text_sequence
+
+
+def winning_side(text_sequence):
+    """A function to determine the winning side of a sequence (left or right)
+    :params str text_sequence: a sequence in text format (can be letters or digits)
+    """
+
+    if letters_or_digits(text_sequence)=='digits': 
+        code_left = '1'
+        code_right = '2'
+    else:
+        code_left = 'l'
+        code_right = 'r'
+    nr_left = text_sequence.count(code_left)
+    winning_side = code_left if (nr_left > len(text_sequence)-nr_left) else code_right
+    return winning_side
+
+
+def left_right_switch(text_sequence):
+    """A function to invert to make the right left and the left right.
+    :params str text_sequence: a sequence in text, can be letters or digits
+    """
+    codes=[]
+    # Check if digits or letters
+    if letters_or_digits(text_sequence)=='digits': 
+        codes = [['1', '_'], ['2', '1'], ['_', '2']]  # 3 steps with placeholder as a little hack
+    else:
+        codes = [['l', '_'], ['r', 'l'], ['_', 'r']]
+
+    for x,y in (codes): 
+        text_sequence = text_sequence.replace(x, y)
+
+    return text_sequence 
+
+
+def make_trial(templates, trial_type, num_tokens, side='r', format_to='letters', rng=None):
+    """A function to create a single trial of the trial list.
+
+    :params dict templates: a dictionary with trial_type as key and the template (list of tuples) as value 
+    :params str trial_type: key of the template to use
+    :params int num_tokens: the number of tokens (the length of the sequence)
+    :params str side: the winning side, 'l' or 'r' (default)
+    :params str format_to: 'letters' (default) or 'digits'
+    :params rng: a numpy Generator (optional, default the random module)
+    """
+
+    template = templates[trial_type[0]]
+
+    # 1-3. Extend the template, calculate plausible ranges and fill in
+    # empty information (computed once per template, see compile_template;
+    # raises a ValueError with the reason if no sequence fits the template)
+    filled_ranges = compile_template(template, t_type=trial_type[0], num_tokens=num_tokens)
+    # 4. Create a sequences of right tokens (uniformly among valid ones)
+    nr_sequence = sample_NR_sequence(filled_ranges, rng=rng)
+    # 5. Create a text sequence in the format expected
+    text_sequence = make_sequence(nr_sequence, format_to=format_to)
+    # 6. Change to winning side
+    # By default all sequences are made with Right side winning.
+    if side == 'l':
+        text_sequence = left_right_switch(text_sequence)
+    # 7. Add to an experimental structure
+    return {'trial_type'     : trial_type,
+            'token_sequence' : text_sequence, 
+            'winning_side'   : winning_side(text_sequence)}
+
+
+def experiment_sequences(templates, num_tokens, nr_per_type, nr_random=0, 
+    randomisation='random', format_to='letters'):
+    """A function to create a trial list.
+
+    :params dict templates: a dictionary with trial_type as key and the template (list of tuples) as value 
+    :params int num_tokens: the number of tokens (the length of the sequence)
+    :params int nr_per_type: number of repetitions of each template
+    :params int nr_random: number of trials sampled randomly from the templates
+    :params str randomisation: whether trials are shuffled ('random') or not 
+    :params str format_to: 'letters' (default) or 'digits'
+    """
+
+    exp_sequences = []
+    trial_keys = []
+
+    for trial_type in templates:
+        for i in range(nr_per_type):
+            # Add key to list with all trials
+            trial_keys += [trial_type]
+
+    # Add random sequences
+    if nr_random > 0:
+        for i in range(nr_random):
+            # Add (random) key to list with all trials
+            trial_keys += [random.choice(list(templates))]
+
+    
+    # For the whole experiment, set 1/2 trials to Left-winning, and 1/2 to Right-winning
+    nr_l = round(len(trial_keys)/ 2)
+    nr_r = len(trial_keys) - nr_l
+    exp_winning_side = random.sample(['l'] * nr_l + ['r'] * nr_r, len(trial_keys))
+
+    # For each key:template transform into the corresponding sequence
+    for i, x in enumerate(trial_keys):
+        exp_sequences += [make_trial(templates, x, num_tokens, 
+                                     side=exp_winning_side[i], format_to=format_to)]
+
+    # Re-order according to need
+    if randomisation == 'random':
+        exp_sequences[:] = random.sample(exp_sequences, len(exp_sequences))
+
+    return exp_sequences
+
+
+def iter_experiment_sequences(templates, num_tokens, nr_per_type=None, nr_random=0, 
+    randomisation='random', format_to='letters'):
+    """A generator version of `experiment_sequences`: trials are created one
+    at a time, when they are needed, instead of building the full list first.
+
+    Trials are drawn without replacement from the remaining counts of each
+    trial type and each winning side, which gives the same shuffled order and
+    the same 50/50 left/right balance as the full list, without holding it.
+    If `nr_per_type` is None the generator never ends: trials are then drawn
+    in blocks holding every trial type once per winning side, so that the
+    sides stay balanced after every block (there are no random trials then).
+
+    :params dict templates: a dictionary with trial_type as key and the template (list of tuples) as value 
+    :params int num_tokens: the number of tokens (the length of the sequence)
+    :params int nr_per_type: number of repetitions of each template (None for endless)
+    :params int nr_random: number of trials sampled randomly from the templates
+    :params str randomisation: whether trials are shuffled ('random') or not 
+    :params str format_to: 'letters' (default) or 'digits'
+    :raises ValueError: if nr_random is given without nr_per_type
+    """
+
+    trial_types = list(templates)
+
+    if nr_per_type is None:
+        if nr_random:
+            raise ValueError('nr_random needs a number of trials per type (nr_per_type), '
+                             'endless sessions have no random trials.')
+        while True:
+            block_types = trial_types * 2
+            block_sides = ['l'] * len(trial_types) + ['r'] * len(trial_types)
+            if randomisation == 'random':
+                random.shuffle(block_types)
+            random.shuffle(block_sides)
+            for trial_type, side in zip(block_types, block_sides):
+                yield make_trial(templates, trial_type, num_tokens, side, format_to)
+
+    # Remaining trials of each type, including the randomly sampled ones
+    remaining = {trial_type: nr_per_type for trial_type in trial_types}
+    for i in range(nr_random):
+        remaining[random.choice(trial_types)] += 1
+    num_trials = sum(remaining.values())
+
+    # For the whole experiment, set 1/2 trials to Left-winning, and 1/2 to Right-winning
+    remaining_l = round(num_trials / 2)
+
+    for trl in range(num_trials):
+        if randomisation == 'random':
+            trial_type = random.choices(trial_types, weights=[remaining[t] for t in trial_types])[0]
+        else:
+            trial_type = next(t for t in trial_types if remaining[t] > 0)
+        remaining[trial_type] -= 1
+        # Side drawn from the remaining ones (probability = share of remaining left)
+        side = 'l' if random.random() * (num_trials - trl) < remaining_l else 'r'
+        if side == 'l':
+            remaining_l -= 1
+        yield make_trial(templates, trial_type, num_tokens, side, format_to)
@@ -0,0 +1,219 @@
+import numpy as np
+from bisect import bisect_right
+
+def grid_positions(side_tokens, token_size):
+    """Positions of the grid cells (every other line and column), before jitter.
+    :returns: array of shape (number of cells, 2), row by row"""
+
+    # Set the lowest and highest token ID on each side
+    low, high = side_tokens // -2, side_tokens // 2
+    steps = np.arange(low, high, 2)  #by steps of 2 to remove alternate lines
+    y, x = np.meshgrid(steps, steps, indexing='ij')
+    return np.column_stack((token_size[0] * x.ravel(), token_size[1] * y.ravel()))
+
+
+def jitter_and_mask(grid, loc, circle_radius, token_size, rng, n=None):
+    """Adds jitter to the grid positions and tells which ones fall inside the
+    circle. With `n`, does it for n arrays at once.
+    :returns: jittered positions and the boolean mask of positions to keep"""
+
+    shape = len(grid) if n is None else (n, len(grid))
+    # ADD JITTER
+    x_pos = grid[:, 0] + rng.uniform(-token_size[0]/2, token_size[0]/2, size=shape)
+    y_pos = grid[:, 1] + rng.uniform(-token_size[0]/2, token_size[1]/2, size=shape)
+    # REMOVE OUT OF CIRCLE ELEMENTS
+    #for a given x_pos, we find a max y_pos that remains within the circle using Pythagora's theorem
+    squared = (circle_radius - token_size[0])**2 - x_pos**2
+    max_y_pos = np.sqrt(np.clip(squared, 0, None))  #0 where there is no solution
+    inside = np.abs(y_pos + loc[0]) <= max_y_pos
+    return np.stack((x_pos, y_pos), axis=-1), inside
+
+
+def create_coordinates(loc, side_tokens, circle_radius, token_size, rng=None):
+    """For each array in each trial, set up the coordinates for each token.
+    Start from a square, remove tokens outside a circle, and add jitter.
+    :param rng: a numpy Generator (optional)
+    :returns: array of shape (number of tokens inside the circle, 2)"""
+
+    if rng is None: rng = np.random.default_rng()
+    grid = grid_positions(side_tokens, token_size)
+    xys, inside = jitter_and_mask(grid, loc, circle_radius, token_size, rng)
+    return xys[inside]
+
+
+def create_coordinates_batch(loc, side_tokens, circle_radius, token_size,
+                             num_trials, num_tokens, rng=None, chunk_size=1000):
+    """Coordinates for all trials in one call: same as `create_coordinates`
+    followed by a random shortlist of `num_tokens` positions, for each trial.
+    :param int num_trials: number of arrays
+    :param int num_tokens: number of tokens kept in each array
+    :param rng: a numpy Generator (optional, seed it for reproducible layouts)
+    :param int chunk_size: arrays computed at once (bounds the working memory)
+    :returns: array of shape (num_trials, num_tokens, 2)"""
+
+    if rng is None: rng = np.random.default_rng()
+    grid = grid_positions(side_tokens, token_size)
+    if len(grid) < num_tokens:
+        raise ValueError('The grid has %s positions, %s are needed.' % (len(grid), num_tokens))
+    all_xys = np.empty((num_trials, num_tokens, 2))
+    for start in range(0, num_trials, chunk_size):
+        n = min(chunk_size, num_trials - start)
+        xys, inside = jitter_and_mask(grid, loc, circle_radius, token_size, rng, n=n)
+        # Jitter again the arrays that have too few tokens inside the circle
+        too_few = np.flatnonzero(inside.sum(axis=1) < num_tokens)
+        while len(too_few):
+            xys[too_few], inside[too_few] = jitter_and_mask(grid, loc, circle_radius,
+                                                            token_size, rng, n=len(too_few))
+            too_few = too_few[inside[too_few].sum(axis=1) < num_tokens]
+        # Shortlist: random order of the positions inside the circle
+        keys = rng.random(inside.shape)
+        keys[~inside] = np.inf
+        shortlist = np.argsort(keys, axis=1)[:, :num_tokens]
+        all_xys[start:start+n] = np.take_along_axis(xys, shortlist[..., None], axis=1)
+    return all_xys
+
+
+def poisson_disc_coordinates(num_tokens, circle_radius, token_size, min_distance=None,
+                             fill=.35, rng=None, max_attempts=100):
+    """Alternative to `create_coordinates`: exactly `num_tokens` positions
+    drawn uniformly inside the circle, with at least `min_distance` between
+    any two tokens (Poisson-disc sampling by dart throwing).
+    Candidates are checked against a spatial hash with cells of
+    min_distance/sqrt(2), which hold at most one token each, so each check
+    only looks at the 5x5 neighbouring cells and the whole layout takes
+    near-linear time.
+    Centers stay within circle_radius - token_size, as in `create_coordinates`.
+    :param int num_tokens: number of tokens
+    :param float circle_radius: radius of the circle
+    :param list token_size: size of a token (the spacing is never below it)
+    :param float min_distance: minimum spacing (optional, default from `fill`)
+    :param float fill: share of the circle covered by disks of diameter 
+        min_distance, used to choose the default spacing
+    :param rng: a numpy Generator (optional)
+    :param int max_attempts: candidates tried per token before the spacing is
+        reduced by 5% (it is never reduced below the token size)
+    :returns: array of shape (num_tokens, 2)"""
+
+    if rng is None: rng = np.random.default_rng()
+    radius = circle_radius - token_size[0]  #largest distance from the center
+    if min_distance is None:
+        min_distance = 2 * radius * np.sqrt(fill / num_tokens)
+    min_distance = max(min_distance, token_size[0])
+    # Most tokens that could fit (hexagonal packing); fewer ones would not either
+    if num_tokens * (np.sqrt(3)/2) * token_size[0]**2 > np.pi * (radius + token_size[0]/2)**2:
+        raise ValueError('%s tokens of size %s do not fit inside a circle of radius %s.'
+                         % (num_tokens, token_size[0], circle_radius))
+
+    while True:
+        xys = _dart_throwing(num_tokens, radius, min_distance, rng, max_attempts)
+        if xys is not None:
+            return xys
+        if min_distance <= token_size[0]:
+            raise ValueError('Could not place %s tokens of size %s inside a circle of radius %s.'
+                             % (num_tokens, token_size[0], circle_radius))
+        min_distance = max(min_distance * .95, token_size[0])
+
+
+def _dart_throwing(num_tokens, radius, min_distance, rng, max_attempts):
+    """Places num_tokens points inside a circle, at least min_distance apart.
+    Returns None if the attempts run out."""
+
+    cell = min_distance / np.sqrt(2)
+    n_cells = int(np.ceil(2 * radius / cell)) + 1
+    grid = np.full((n_cells + 4, n_cells + 4), -1)  #2 cells of padding on each side
+    xys = np.zeros((num_tokens, 2))
+    squared_distance = min_distance**2
+    placed = 0
+    attempts = num_tokens * max_attempts
+    block = max(64, 2 * num_tokens)
+    while attempts > 0:
+        # Candidates uniformly inside the circle, drawn by blocks
+        angles = rng.uniform(0, 2*np.pi, block)
+        radii = radius * np.sqrt(rng.uniform(0, 1, block))
+        candidates = np.column_stack((radii * np.cos(angles), radii * np.sin(angles)))
+        cells = ((candidates + radius) / cell).astype(int) + 2
+        for (x, y), (i, j) in zip(candidates.tolist(), cells.tolist()):
+            attempts -= 1
+            neighbours = grid[i-2:i+3, j-2:j+3]
+            neighbours = neighbours[neighbours >= 0]
+            if len(neighbours):
+                dx = xys[neighbours, 0] - x
+                dy = xys[neighbours, 1] - y
+                if (dx*dx + dy*dy < squared_distance).any():
+                    if attempts == 0: return None
+                    continue
+            grid[i, j] = placed
+            xys[placed] = x, y
+            placed += 1
+            if placed == num_tokens:
+                return xys
+            if attempts == 0: return None
+    return None
+
+
+def poisson_disc_batch(num_trials, num_tokens, circle_radius, token_size, 
+                       min_distance=None, rng=None):
+    """`poisson_disc_coordinates` for all trials.
+    :returns: array of shape (num_trials, num_tokens, 2)"""
+
+    if rng is None: rng = np.random.default_rng()
+    return np.stack([poisson_disc_coordinates(num_tokens, circle_radius, token_size, 
+                                              min_distance, rng=rng)
+                     for trl in range(num_trials)])
+
+
+def token_masks(token_sequence):
+    """Which tokens are visible in the central, left and right arrays at each
+    step of a trial (same sets as the `i_now` index lists of tokens.py).
+    Row t is the step when token t moves; the extra last row is the full 
+    central array shown before the trial starts.
+    :param str token_sequence: sequence of left-right movements
+    :returns: dict with 'c', 'l', 'r' boolean arrays of shape (num_tokens+1, num_tokens)"""
+
+    num_tokens = len(token_sequence)
+    moved = np.tri(num_tokens + 1, num_tokens, dtype=bool)  #moved[t, i] is i <= t
+    moved[num_tokens] = False
+    codes = np.frombuffer(token_sequence.encode('ascii'), dtype=np.uint8)
+    left = (codes == ord('l')) | (codes == ord('1'))
+    return {'c': ~moved, 'l': moved & left, 'r': moved & ~left}
+
+
+def token_settings(token_sequence, loc, c_offset, rng=None, order=None):
+    """Settings of the central, left and right token arrays of a trial.
+    `pos`: main position: central, left or right
+    `i_all`: indices for all tokens that will go either left or right
+    `i_now`: indices of tokens that will be shown at a given moment
+    :param str token_sequence: sequence of left-right movements
+    :param loc: position of the central array
+    :param float c_offset: offset of the side arrays in the x axis
+    :param rng: a numpy Generator (optional)
+    :param order: indices of the central array (optional, default a random
+        permutation from rng), e.g. the 'i_all' of a stored trial"""
+
+    num_tokens = len(token_sequence)
+    if order is None:
+        if rng is None: rng = np.random.default_rng()
+        order = rng.permutation(num_tokens)  # Shuffle list of indices for the shortlisted xys list
+    stgs = {'c' : {
+        'pos'  : loc,
+        'i_all': [int(i) for i in order],
+        'i_now': [ [] for i in range(num_tokens) ]
+        }, 
+            'l'   : {
+        'pos'  : (loc - np.array((c_offset, 0))),
+        'i_all': [i for i, x in enumerate(token_sequence) if x == 'l'],
+        'i_now': [ [] for i in range(num_tokens) ] 
+        },
+            'r'  : {
+        'pos'  : (loc + np.array((c_offset, 0))),
+        'i_all': [i for i, x in enumerate(token_sequence) if x == 'r'],
+        'i_now': [ [] for i in range(num_tokens) ] 
+        }
+    }
+    # Update array indices at each moment in time
+    for this_token in range(num_tokens):
+        for side in 'l', 'r':
+            stgs[side]['i_now'][this_token] = stgs[side]['i_all'][:bisect_right(stgs[side]['i_all'], this_token)]
+        # Now remove the sides indices from the center indices
+        stgs['c']['i_now'][this_token] = [x for x in stgs['c']['i_all'] if x > this_token]
+    return stgs
@@ -0,0 +1,138 @@
+import atexit
+import csv
+import os
+import queue
+import threading
+import numpy as np
+
+"""
+Asynchronous trial writer.
+
+Rows are handed to a background thread through a bounded queue and written to
+the CSV file in batches, so the display thread never pays for file I/O or
+serialisation. The per-frame arrays (path, times, velocity) can also go to a
+binary sidecar: a folder with one `trial_<k>.npz` per trial, written once
+(to a temporary file, then renamed) before the trial's row goes to the CSV
+file, so a crash loses at most the trials of the batch being written, and
+nothing of the past trials is kept in memory.
+"""
+
+# Marks the end of the items in a writer queue
+_CLOSE = object()
+
+
+def open_writer(filename, header, sidecar=None, batch_size=16, max_queue=256):
+    """Starts a writer thread for a CSV file (and an optional sidecar folder).
+    The folder is created if needed and the header is written if the file is empty.
+    :param str filename: the CSV file (rows are appended)
+    :param tuple header: column names
+    :param str sidecar: folder for the per-frame arrays (optional, created if needed)
+    :param int batch_size: most rows written at once
+    :param int max_queue: most rows waiting to be written
+    :returns: dict with the state of the writer
+    """
+
+    folder = os.path.dirname(filename)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder) #if this fails (e.g. permissions) you will get an error
+    if sidecar is not None and not os.path.isdir(sidecar):
+        os.makedirs(sidecar)
+
+    writer = {'filename' : filename,
+              'sidecar'  : sidecar,
+              'queue'    : queue.Queue(maxsize=max_queue),
+              'error'    : None,
+              'closed'   : False}
+
+    def worker():
+        try:
+            with open(filename, 'a', newline='') as save_file:
+                file_writer = csv.writer(save_file, delimiter=',')
+                if os.stat(filename).st_size == 0: #if file is empty, insert header
+                    file_writer.writerow(header)
+                    save_file.flush()
+                done = False
+                while not done:
+                    items = [writer['queue'].get()]
+                    # Take what else is waiting, up to a batch
+                    while len(items) < batch_size:
+                        try: items += [writer['queue'].get_nowait()]
+                        except queue.Empty: break
+                    rows = []
+                    for item in items:
+                        if item is _CLOSE:
+                            done = True
+                            break
+                        row, frames = item
+                        rows += [[csv_value(value) for value in row]]
+                        if frames is not None and sidecar is not None:
+                            save_trial_frames(sidecar, frames)
+                    file_writer.writerows(rows)
+                    save_file.flush()
+        except BaseException as error:
+            writer['error'] = error
+
+    writer['thread'] = threading.Thread(target=worker, daemon=True)
+    writer['thread'].start()
+    atexit.register(close_writer, writer)  #also save when quitting with core.quit()
+    return writer
+
+
+def writer_put(writer, row, frames=None):
+    """Hands a row (and optionally the per-frame arrays of the trial) to the
+    writer. Only blocks if `max_queue` rows are already waiting.
+    :param dict writer: writer from `open_writer`
+    :param tuple row: values of the CSV row
+    :param dict frames: 'trial', 'path', 'times' and 'velocity' (optional, for the sidecar)
+    """
+
+    if writer['error'] is not None:
+        raise writer['error']
+    writer['queue'].put((row, frames))
+
+
+def close_writer(writer):
+    """Writes the remaining rows (and their frames) and stops the thread.
+    :param dict writer: writer from `open_writer`
+    """
+
+    if writer['closed']:
+        return
+    writer['closed'] = True
+    writer['queue'].put(_CLOSE)
+    writer['thread'].join()
+    if writer['error'] is not None:
+        raise writer['error']
+
+
+def csv_value(value):
+    """Converts NumPy arrays to the list format used in the CSV columns:
+    a list of (x, y) tuples for 2-D arrays and a list of numbers for 1-D
+    arrays, with 'NA' in place of NaN. Other values are left as they are.
+    """
+
+    if not isinstance(value, np.ndarray):
+        return value
+    if value.ndim == 2:
+        return [tuple(x) for x in value.tolist()]
+    return ['NA' if x != x else x for x in value.tolist()]  #x != x for NaN
+
+
+def save_trial_frames(sidecar, frames):
+    """Saves the per-frame arrays of one trial as `trial_<k>.npz` in the
+    sidecar folder. Velocity values that are not numbers ('NA') are stored
+    as NaN. The values can be lists or NumPy arrays.
+    :param str sidecar: folder of the sidecar
+    :param dict frames: 'trial', 'path', 'times' and 'velocity' of the trial
+    """
+
+    velocity = frames['velocity']
+    if not isinstance(velocity, np.ndarray):
+        velocity = [x if isinstance(x, (int, float)) else np.nan for x in velocity]
+    filename = sidecar + os.path.sep + 'trial_%s.npz' % frames['trial']
+    with open(filename + '.tmp', 'wb') as trial_file:
+        np.savez(trial_file,
+                 path=np.asarray(frames['path'], dtype=float).reshape(-1, 2),
+                 times=np.asarray(frames['times'], dtype=float),
+                 velocity=np.asarray(velocity, dtype=float))
+    os.replace(filename + '.tmp', filename)
@@ -1,25 +0,0 @@
-import numpy as np
-from math import sqrt, floor
-
-def create_coordinates(loc, side_tokens, circle_radius, token_size):
-    """For each array in each trial, set up the coordinates for each token.
-    Start from a square, remove tokens outside a circle, and add jitter."""
-
-    xys = [] #empty array of coordinates
-    # Set the lowest and highest token ID on each side
-    low, high = side_tokens // -2, side_tokens // 2
-    # Populate xys
-    for y in range(low, high, 2):  #by steps of 2 to remove alternate lines
-        for x in range(low, high, 2):
-            x_pos = token_size[0] * x
-            y_pos = token_size[1] * y
-            # ADD JITTER
-            x_pos = x_pos + np.random.uniform(-token_size[0]/2, token_size[0]/2)
-            y_pos = y_pos + np.random.uniform(-token_size[0]/2, token_size[1]/2)
-            # REMOVE OUT OF CIRCLE ELEMENTS
-            #for a given x_pos, we find a max y_pos that remains within the circle using Pythagora's theorem
-            try: max_y_pos = sqrt((circle_radius-(token_size[0]))**2 - x_pos**2)
-            except: max_y_pos = 0  #to avoid error with sqrt(0)
-            if (y_pos+loc[0]) > max_y_pos or (y_pos+loc[0]) < -max_y_pos : continue
-            else: xys.append((x_pos, y_pos))
-    return xys
\ No newline at end of file